@@ -0,0 +1,311 @@
+# ai_reply.py
+import os
+import json
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from reply_cache import REPLY_CACHE, cache_key, cached_reply
+
+# AI demo reply route. requests is imported on first call so the
+# api/generate_reply_prompt.py entry point cold-starts quickly.
+ai_bp = Blueprint("ai_reply", __name__)
+
+GROQ_MODEL = "llama-3.1-8b-instant"
+GROQ_PARAMS = {"temperature": 0.7, "max_tokens": 1024, "top_p": 0.8}
+SYSTEM_PROMPT = "You are a professional real estate agent. Generate concise, professional responses that help convert leads into appointments."
+# Reply cache parameters, shared by the plain and streaming routes
+CACHE_PARAMS = dict(GROQ_PARAMS, system=SYSTEM_PROMPT)
+
+SECTION_MARKERS = {
+    "=== REPLY ===": "reply",
+    "=== FOLLOW UP 1 ===": "follow_up_1",
+    "=== FOLLOW UP 2 ===": "follow_up_2",
+    "=== FOLLOW UP 3 ===": "follow_up_3",
+}
+
+def build_prompt(prompt):
+    """Enhanced prompt to generate reply and three follow-ups"""
+    return f"""
+    Generate a professional real estate agent reply to the following email, and then generate three follow-up emails that would be sent later.
+    Format your response exactly as follows:
+
+    === REPLY ===
+    [Your main reply here]
+
+    === FOLLOW UP 1 ===
+    [First follow-up email]
+
+    === FOLLOW UP 2 ===
+    [Second follow-up email]
+
+    === FOLLOW UP 3 ===
+    [Third follow-up email]
+
+    Email to respond to:
+    {prompt}
+    """
+
+def _preflight():
+    response = jsonify({"status": "ok"})
+    response.headers.add("Access-Control-Allow-Origin", "https://replyzeai.com")
+    response.headers.add("Access-Control-Allow-Headers", "Content-Type")
+    return response
+
+@ai_bp.route('/api/generate-reply-prompt', methods=['OPTIONS', 'POST'])
+def generate_reply_prompt():
+    if request.method == "OPTIONS":
+        # Handle preflight request
+        return _preflight()
+
+    data = request.get_json(force=True)
+    prompt = data.get("prompt", "").strip()
+    if not prompt:
+        return jsonify({"error": "Missing prompt"}), 400
+
+    enhanced_prompt = build_prompt(prompt)
+
+    try:
+        # Use Groq API instead of GitHub AI models
+        GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
+        if not GROQ_API_KEY:
+            return jsonify({"error": "Groq API key not configured"}), 500
+
+        result, hit = cached_reply(
+            enhanced_prompt, GROQ_MODEL, CACHE_PARAMS,
+            lambda: parse_sections(groq_completion(enhanced_prompt, GROQ_API_KEY))
+        )
+
+        # Add CORS headers to the response
+        response = jsonify(result)
+        response.headers.add("Access-Control-Allow-Origin", "https://replyzeai.com")
+        response.headers["X-Cache"] = "HIT" if hit else "MISS"
+        return response
+        
+    except Exception as e:
+        print(f"Error generating reply with Groq: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+# ---------- Streaming ----------
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@ai_bp.route('/api/generate-reply-prompt/stream', methods=['OPTIONS', 'GET', 'POST'])
+def generate_reply_prompt_stream():
+    """
+    Same reply as generate_reply_prompt, streamed as Server-Sent Events:
+    "section" when a section starts, "delta" for its text as the model
+    writes it, then "done" with the parsed result (or "error"). GET takes
+    ?prompt= for EventSource; POST takes the usual JSON body.
+    """
+    if request.method == "OPTIONS":
+        return _preflight()
+
+    if request.method == "GET":
+        prompt = request.args.get("prompt", "").strip()
+    else:
+        prompt = (request.get_json(force=True, silent=True) or {}).get("prompt", "").strip()
+    if not prompt:
+        return jsonify({"error": "Missing prompt"}), 400
+
+    GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
+    if not GROQ_API_KEY:
+        return jsonify({"error": "Groq API key not configured"}), 500
+
+    enhanced_prompt = build_prompt(prompt)
+    key = cache_key(enhanced_prompt, GROQ_MODEL, CACHE_PARAMS)
+    cached = REPLY_CACHE.get(key)
+
+    def events():
+        if cached is not None:
+            sections = [("reply", cached["reply"])] + [
+                (f"follow_up_{i}", text) for i, text in enumerate(cached["follow_ups"], 1)
+            ]
+            for name, text in sections:
+                yield _sse("section", {"section": name})
+                yield _sse("delta", {"section": name, "text": text})
+            yield _sse("done", cached)
+            return
+
+        parser = SectionStream()
+        chunks = []
+        try:
+            for delta in groq_stream(enhanced_prompt, GROQ_API_KEY):
+                chunks.append(delta)
+                for event in parser.feed(delta):
+                    yield _sse(*event)
+            for event in parser.close():
+                yield _sse(*event)
+        except Exception as e:
+            print(f"Error streaming reply from Groq: {str(e)}")
+            yield _sse("error", {"error": str(e)})
+            return
+
+        result = parse_sections("".join(chunks))
+        if result["reply"]:
+            REPLY_CACHE.set(key, result)
+        yield _sse("done", result)
+
+    response = Response(stream_with_context(events()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    # Stop proxies from buffering the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    response.headers["X-Cache"] = "HIT" if cached is not None else "MISS"
+    response.headers.add("Access-Control-Allow-Origin", "https://replyzeai.com")
+    return response
+
+class SectionStream:
+    """
+    Incremental parse_sections: feed() model output as it arrives and get
+    back ("section", {...}) and ("delta", {...}) events. Text that could
+    still turn out to be a marker line is held until the line completes;
+    anything else is passed on straight away.
+    """
+
+    def __init__(self):
+        self.section = None
+        self.line = ""
+        self.sent = 0
+
+    def feed(self, text):
+        events = []
+        while text:
+            head, newline, text = text.partition("\n")
+            self.line += head
+            events += self._end_line() if newline else self._partial()
+        return events
+
+    def close(self):
+        if not self.line:
+            return []
+        events = self._end_line()
+        # No trailing newline was seen; drop the one _end_line added
+        if events and events[-1][0] == "delta":
+            events[-1][1]["text"] = events[-1][1]["text"][:-1]
+        return [e for e in events if e[0] != "delta" or e[1]["text"]]
+
+    def _end_line(self):
+        line, sent = self.line, self.sent
+        self.line, self.sent = "", 0
+        marker = SECTION_MARKERS.get(line.strip())
+        if marker and not sent:
+            self.section = marker
+            return [("section", {"section": marker})]
+        if self.section is None:
+            return []
+        return [("delta", {"section": self.section, "text": line[sent:] + "\n"})]
+
+    def _partial(self):
+        if self.section is None or len(self.line) == self.sent:
+            return []
+        if not self.sent:
+            start = self.line.lstrip()
+            if any(marker.startswith(start) for marker in SECTION_MARKERS):
+                return []
+        text, self.sent = self.line[self.sent:], len(self.line)
+        return [("delta", {"section": self.section, "text": text})]
+
+def groq_stream(enhanced_prompt, api_key):
+    """Yield text deltas of a streamed Groq chat completion"""
+    import requests
+    with requests.post(
+        "https://api.groq.com/openai/v1/chat/completions",
+        headers={
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        },
+        json={
+            "model": GROQ_MODEL,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": enhanced_prompt}
+            ],
+            "stream": True,
+            **GROQ_PARAMS
+        },
+        stream=True,
+        timeout=30
+    ) as response:
+        if response.status_code != 200:
+            raise GroqError(response.status_code)
+
+        # OpenAI-style SSE: "data: {chunk}" lines, ending with "data: [DONE]"
+        response.encoding = "utf-8"
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            payload = line[5:].strip()
+            if payload == "[DONE]":
+                break
+            choices = json.loads(payload).get("choices") or [{}]
+            delta = (choices[0].get("delta") or {}).get("content")
+            if delta:
+                yield delta
+
+# ---------- Completion helpers ----------
+class GroqError(RuntimeError):
+    """Groq answered with an error status; 5xx are worth retrying"""
+
+    def __init__(self, status_code):
+        super().__init__(f"Groq API error: {status_code}")
+        self.status_code = status_code
+        self.transient = status_code >= 500
+
+class GroqRateLimited(GroqError):
+    """Groq answered 429; retry_after is its Retry-After in seconds, if any"""
+
+    def __init__(self, retry_after=None):
+        super().__init__(429)
+        self.retry_after = retry_after
+
+def groq_completion(enhanced_prompt, api_key, system=SYSTEM_PROMPT, params=GROQ_PARAMS):
+    """Full text of a Groq chat completion for the prompt"""
+    import requests
+    response = requests.post(
+        "https://api.groq.com/openai/v1/chat/completions",
+        headers={
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        },
+        json={
+            "model": GROQ_MODEL,  # You can change this to other Groq models
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": enhanced_prompt}
+            ],
+            **params
+        },
+        timeout=30
+    )
+
+    if response.status_code == 429:
+        retry_after = response.headers.get("Retry-After")
+        raise GroqRateLimited(float(retry_after) if retry_after and retry_after.replace(".", "", 1).isdigit() else None)
+    if response.status_code != 200:
+        raise GroqError(response.status_code)
+
+    result = response.json()
+    return result["choices"][0]["message"]["content"].strip()
+
+def parse_sections(full_response):
+    """Split the model output into {"reply": ..., "follow_ups": [...]}"""
+    sections = {}
+    current_section = None
+    lines = full_response.split('\n')
+    
+    for line in lines:
+        line = line.strip()
+        if line in SECTION_MARKERS:
+            current_section = SECTION_MARKERS[line]
+            sections[current_section] = []
+        elif current_section and line:
+            sections[current_section].append(line)
+    
+    # Join the lines for each section
+    reply = ' '.join(sections.get('reply', [])).strip()
+    follow_ups = [
+        ' '.join(sections.get('follow_up_1', [])).strip(),
+        ' '.join(sections.get('follow_up_2', [])).strip(),
+        ' '.join(sections.get('follow_up_3', [])).strip()
+    ]
+    
+    # Remove any empty follow-ups
+    follow_ups = [fu for fu in follow_ups if fu]
+    return {"reply": reply, "follow_ups": follow_ups}
@@ -0,0 +1,162 @@
+# ai_usage.py
+import os
+import uuid
+import atexit
+import threading
+from datetime import datetime, timezone
+from db import supabase, execute, rpc, is_missing_function, not_applied
+
+# Demo usage is counted in memory and flushed every AI_USAGE_FLUSH_SECONDS
+# (or sooner once AI_USAGE_FLUSH_MAX leads are pending) as one atomic
+# upsert-increment, so recording a use costs the request no round-trips.
+# Each flush carries a batch id and the database skips ids it has already
+# applied, so a batch whose outcome is unknown (timeout, 5xx) is simply
+# sent again as-is.
+AI_USAGE_FLUSH_SECONDS = float(os.environ.get('AI_USAGE_FLUSH_SECONDS', 5))
+AI_USAGE_FLUSH_MAX = int(os.environ.get('AI_USAGE_FLUSH_MAX', 500))
+
+class UsageBuffer:
+    def __init__(self, interval=AI_USAGE_FLUSH_SECONDS, max_pending=AI_USAGE_FLUSH_MAX):
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending = {}
+        # [(batch id, entries)] whose write failed; retried unchanged
+        self._unsent = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def record(self, lead_id, count=1):
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            entry = self._pending.get(lead_id)
+            if entry:
+                entry["count"] += count
+                entry["last_used_at"] = now
+            else:
+                self._pending[lead_id] = {"lead_id": lead_id, "count": count,
+                                          "first_used_at": now, "last_used_at": now}
+            full = len(self._pending) >= self.max_pending
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ai-usage-flush", daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def pending(self, lead_id):
+        """Uses of lead_id recorded here but not flushed yet"""
+        with self._lock:
+            entry = self._pending.get(lead_id)
+            count = entry["count"] if entry else 0
+            for _, batch in self._unsent:
+                count += sum(e["count"] for e in batch if e["lead_id"] == lead_id)
+            return count
+
+    def _merge(self, entries):
+        """Put entries that were never written back into the pending counts"""
+        with self._lock:
+            for entry in entries:
+                current = self._pending.get(entry["lead_id"])
+                if current:
+                    current["count"] += entry["count"]
+                    current["first_used_at"] = entry["first_used_at"]
+                else:
+                    self._pending[entry["lead_id"]] = entry
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batches, self._unsent = self._unsent, []
+                if self._pending:
+                    batches.append((str(uuid.uuid4()), list(self._pending.values())))
+                    self._pending = {}
+
+            written = 0
+            for batch_id, batch in batches:
+                try:
+                    unwritten = write_usage(batch, batch_id)
+                except Exception as e:
+                    print(f"Error flushing AI usage ({len(batch)} leads), will retry: {str(e)}")
+                    with self._lock:
+                        self._unsent.append((batch_id, batch))
+                    continue
+                # Only the row-by-row fallback leaves entries behind, and only
+                # ones it never wrote
+                self._merge(unwritten)
+                written += len(batch) - len(unwritten)
+            return written
+
+def write_usage(batch, batch_id):
+    """
+    Write a batch of usage counts. Returns the entries that weren't written
+    and can safely be counted again later.
+    """
+    try:
+        # One atomic, idempotent upsert-increment (see sql/009 and sql/010)
+        rpc("record_ai_usage", {"p_usage": batch, "p_batch_id": batch_id}, idempotent=True)
+        return []
+    except Exception as e:
+        # Anything but a missing function may have been applied: retry the
+        # batch, never replay it row by row
+        if not is_missing_function(e):
+            raise
+        print(f"record_ai_usage RPC unavailable, updating row by row: {str(e)}")
+    return write_usage_rows(batch)
+
+def write_usage_rows(batch):
+    """
+    Read-modify-write per email. Only this flusher writes, so increments
+    aren't lost within a process. Stops at the first failure and returns
+    the entries not written; an entry whose write may have gone through is
+    dropped rather than risk counting it twice.
+    """
+    for i, entry in enumerate(batch):
+        try:
+            lead = execute(supabase.table("leads").select("email").eq("id", entry["lead_id"]))
+            if not lead.data:
+                continue
+            email = lead.data[0]["email"]
+            existing = execute(supabase.table("ai_demo_usage").select("usage_count").eq("email", email))
+        except Exception as e:
+            print(f"Error reading AI usage for lead {entry['lead_id']}: {str(e)}")
+            return batch[i:]
+
+        try:
+            if existing.data:
+                execute(supabase.table("ai_demo_usage").update({
+                    "usage_count": existing.data[0]["usage_count"] + entry["count"],
+                    "last_used_at": entry["last_used_at"]
+                }).eq("email", email), idempotent=False)
+            else:
+                execute(supabase.table("ai_demo_usage").insert({
+                    "lead_id": entry["lead_id"],
+                    "email": email,
+                    "usage_count": entry["count"],
+                    "first_used_at": entry["first_used_at"],
+                    "last_used_at": entry["last_used_at"]
+                }), idempotent=False)
+        except Exception as e:
+            if not_applied(e):
+                return batch[i:]
+            print(f"Error writing AI usage for lead {entry['lead_id']}, dropping {entry['count']} use(s): {str(e)}")
+            return batch[i + 1:]
+    return []
+
+USAGE = UsageBuffer()
+atexit.register(USAGE.flush)
+
+def with_pending(usage, lead_id, email):
+    """An ai_demo_usage row (or None) plus the uses this process hasn't flushed yet"""
+    pending = USAGE.pending(lead_id)
+    if not pending:
+        return usage
+    usage = dict(usage or {"lead_id": lead_id, "email": email, "usage_count": 0})
+    usage["usage_count"] += pending
+    return usage
@@ -0,0 +1,13 @@
+# api/generate_reply_prompt.py
+# Lightweight serverless entry point for the AI demo reply endpoint.
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from ai_reply import ai_bp, generate_reply_prompt
+
+app = Flask(__name__)
+app.register_blueprint(ai_bp)
+# vercel.json rewrites the public path to this function's path
+app.add_url_rule('/api/generate_reply_prompt', view_func=generate_reply_prompt, methods=['OPTIONS', 'POST'])
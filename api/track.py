@@ -0,0 +1,12 @@
+# api/track.py
+# Lightweight serverless entry point for click tracking: loads only Flask
+# and the tracking routes, not the admin app.
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from tracking import tracking_bp
+
+app = Flask(__name__)
+app.register_blueprint(tracking_bp)
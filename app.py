@@ -1,51 +1,22 @@
 # app.py
 import os
-import base64
-import json
 import traceback
-import secrets
-import csv
-import io
-import requests
-import smtplib
-import imaplib
-import ssl
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email.mime.text import MIMEText
-from datetime import datetime, timedelta, timezone, date
-from flask import Flask, request, redirect, render_template, jsonify, current_app
+from datetime import datetime, timedelta, timezone
+from flask import Flask, Response, request, render_template, jsonify, current_app
 from dotenv import load_dotenv
-from supabase import create_client
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-from email_validator import validate_email, EmailNotValidError
-from urllib.parse import urlencode
-import urllib.parse
-
-
-# Supabase server-side client (service role)
-SUPABASE_URL = os.environ['SUPABASE_URL']
-SUPABASE_KEY = os.environ['SUPABASE_SERVICE_ROLE_KEY']
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-# Encryption key (32 bytes hex)
-ENCRYPTION_KEY = bytes.fromhex(os.environ['ENCRYPTION_KEY'])
+from db import supabase, bulk_insert, bulk_upsert, fetch
+from metrics import REGISTRY, render_last_run
+from tracing import init_tracing
+from ai_usage import USAGE, with_pending
+from lead_summary import get_summary, invalidate_lead, invalidate_all
+from send_limits import account_capacity, lookback_window
+from tracking import tracking_bp
+from ai_reply import ai_bp
+
+# smtplib, csv, email_validator and the Supabase client are loaded on first
+# use so cold starts only pay for what a request actually touches.
 
 # ---------- Helpers ----------
-def aesgcm_encrypt(plaintext: str) -> str:
-    aesgcm = AESGCM(ENCRYPTION_KEY)
-    nonce = secrets.token_bytes(12)
-    ct = aesgcm.encrypt(nonce, plaintext.encode('utf-8'), None)
-    return base64.b64encode(nonce + ct).decode('utf-8')
-
-def aesgcm_decrypt(b64text: str) -> str:
-    data = base64.b64decode(b64text)
-    nonce = data[:12]
-    ct = data[12:]
-    aesgcm = AESGCM(ENCRYPTION_KEY)
-    pt = aesgcm.decrypt(nonce, ct, None)
-    return pt.decode('utf-8')
-
 def render_email_template(template, lead_data):
     """Replace template variables with lead data and preserve whitespace"""
     rendered = template
@@ -85,6 +56,10 @@ CORS(app, resources={
     }
 })
 
+app.register_blueprint(tracking_bp)
+app.register_blueprint(ai_bp)
+init_tracing(app)
+
 # Your existing routes...
 # ---------- Routes ----------
 @app.route('/')
@@ -95,6 +70,21 @@ def index():
 def admin():
     return render_template('admin.html')
 
+@app.route('/metrics')
+def metrics():
+    """
+    Prometheus metrics: this process's counters, plus the most recent
+    worker run as worker_last_run_* gauges
+    """
+    body = REGISTRY.render()
+    try:
+        last_run = fetch("worker_metrics", columns="snapshot", order="created_at", desc=True, limit=1)
+        if last_run:
+            body += render_last_run(last_run[0]["snapshot"])
+    except Exception as e:
+        app.logger.error("Error loading worker metrics: %s", e)
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
 # Remove Google OAuth routes and add SMTP account routes
 @app.route('/api/smtp-accounts', methods=['GET'])
 def api_get_smtp_accounts():
@@ -108,30 +98,23 @@ def api_get_smtp_accounts():
 @app.route('/api/account-status', methods=['GET'])
 def api_get_account_status():
     try:
-        today = date.today().isoformat()
-        
-        # Get all SMTP accounts with their daily counts
+        # Get all SMTP accounts with their rolling-window usage
         accounts = supabase.table("smtp_accounts").select("*").execute()
+        capacity = account_capacity(supabase, accounts.data)
+        window_hours = round(lookback_window().total_seconds() / 3600, 2)
         
         statuses = []
         for account in accounts.data:
-            # Get today's count for this account
-            count_data = supabase.table("daily_email_counts") \
-                .select("count") \
-                .eq("email_account", account["email"]) \
-                .eq("date", today) \
-                .execute()
-            
-            if count_data.data:
-                count = count_data.data[0]["count"]
-            else:
-                count = 0
-                
+            usage = capacity[account["email"]]
             statuses.append({
                 "email": account["email"],
                 "display_name": account["display_name"],
-                "sent_today": count,
-                "remaining_today": 100 - count
+                # Not calendar-day counts: sends within the rolling lookback
+                # window, and what the token bucket allows right now
+                "daily_limit": usage["limit"],
+                "sent_in_window": usage["sent_recent"],
+                "window_hours": window_hours,
+                "available_now": usage["remaining"]
             })
         
         return jsonify({"ok": True, "accounts": statuses}), 200
@@ -207,10 +190,8 @@ def api_create_campaign():
                     })
                 
                 # Insert in chunks
-                CHUNK_SIZE = 100
-                for i in range(0, len(email_queue), CHUNK_SIZE):
-                    chunk = email_queue[i:i+CHUNK_SIZE]
-                    supabase.table("email_queue").insert(chunk).execute()
+                bulk_insert("email_queue", email_queue)
+                invalidate_all()
                 
                 print(f"DEBUG: Queued {len(email_queue)} emails with scheduled_for: {datetime.now(timezone.utc).isoformat()}")
         
@@ -264,12 +245,9 @@ def api_queue_followup():
             })
         
         # Insert in chunks
-        CHUNK_SIZE = 100
-        total_queued = 0
-        for i in range(0, len(email_queue), CHUNK_SIZE):
-            chunk = email_queue[i:i+CHUNK_SIZE]
-            result = supabase.table("email_queue").insert(chunk).execute()
-            total_queued += len(chunk)
+        bulk_insert("email_queue", email_queue)
+        total_queued = len(email_queue)
+        invalidate_all()
         
         return jsonify({"ok": True, "queued": total_queued}), 200
         
@@ -300,6 +278,8 @@ def api_get_lead_lists():
 @app.route('/api/leads/import', methods=['POST'])
 @app.route('/api/leads/import', methods=['POST'])
 def api_import_leads():
+    from lead_import import parse_leads, LeadImportError
+
     try:
         # ---------- Validate upload ----------
         if 'file' not in request.files:
@@ -311,128 +291,16 @@ def api_import_leads():
         if not file.filename or not file.filename.lower().endswith('.csv'):
             return jsonify({"error": "Only CSV files are supported"}), 400
 
-        # ---------- Decode file safely ----------
-        raw = file.read()
-        decoded = None
-        for enc in ('utf-8', 'latin-1', 'windows-1252', 'iso-8859-1'):
-            try:
-                decoded = raw.decode(enc)
-                break
-            except UnicodeDecodeError:
-                continue
-        if decoded is None:
-            decoded = raw.decode('latin-1')
-
-        stream = io.StringIO(decoded)
-        reader = csv.DictReader(stream)
-
-        if not reader.fieldnames:
-            return jsonify({"error": "CSV has no headers"}), 400
-
-        if 'email' not in [h.lower() for h in reader.fieldnames]:
-            return jsonify({"error": "CSV must contain an email column"}), 400
-
-        # ---------- Header normalization ----------
-        HEADER_ALIASES = {
-            # AI hooks
-            "ai hook": "ai hooks",
-            "ai hooks": "ai hooks",
-            "ai_hook": "ai hooks",
-
-            # Last sale
-            "lastsale": "last sale",
-            "last sale": "last sale",
-            "last_sale": "last sale",
-
-            # Open house
-            "openhouse": "open house",
-            "open house": "open house",
-            "open_house": "open house",
-
-            # Name variants
-            "lastname": "last name",
-            "last_name": "last name",
-        }
-
-        STANDARD_FIELDS = {
-            "email",
-            "name",
-            "last name",
-            "city",
-            "brokerage",
-            "service",
-            "street",
-            "ai hooks",
-            "open house",
-            "last sale",
-        }
-
-        leads_by_email = {}
-
-        # ---------- Process rows ----------
-        for row in reader:
-            if not row:
-                continue
-
-            # Normalize keys + trim values
-            cleaned = {}
-            for k, v in row.items():
-                if not k:
-                    continue
-                key = k.strip().lower()
-                key = HEADER_ALIASES.get(key, key)
-                cleaned[key] = v.strip() if v else ""
-
-            email = cleaned.get("email", "").lower()
-            if not email:
-                continue
-
-            # Validate email
-            try:
-                validate_email(email)
-            except EmailNotValidError:
-                continue
-
-            # Extract custom fields
-            custom_fields = {
-                k: v for k, v in cleaned.items()
-                if k not in STANDARD_FIELDS
-            }
-
-            lead = {
-                "email": email,
-                "name": cleaned.get("name", ""),
-                "last_name": cleaned.get("last name", ""),
-                "city": cleaned.get("city", ""),
-                "brokerage": cleaned.get("brokerage", ""),
-                "service": cleaned.get("service", ""),
-                "street": cleaned.get("street", ""),
-                "ai_hooks": cleaned.get("ai hooks", ""),
-                "open_house": cleaned.get("open house", ""),
-                "last_sale": cleaned.get("last sale", ""),
-                "list_name": list_name,
-                "custom_fields": custom_fields
-            }
-
-            # Deduplicate by email (last wins)
-            leads_by_email[email] = lead
-
-        leads = list(leads_by_email.values())
+        # ---------- Parse + normalize rows ----------
+        try:
+            leads = parse_leads(file.read(), list_name)
+        except LeadImportError as e:
+            return jsonify({"error": str(e)}), 400
 
         # ---------- Insert into Supabase ----------
         if leads:
-            CHUNK_SIZE = 100
-            for i in range(0, len(leads), CHUNK_SIZE):
-                chunk = leads[i:i + CHUNK_SIZE]
-                result = supabase.table("leads") \
-                    .upsert(chunk, on_conflict="email") \
-                    .execute()
-
-                if getattr(result, "error", None):
-                    return jsonify({
-                        "error": "db_error",
-                        "detail": str(result.error)
-                    }), 500
+            bulk_upsert("leads", leads, on_conflict="email")
+            invalidate_all()
 
         return jsonify({
             "ok": True,
@@ -463,6 +331,9 @@ def api_add_smtp_account():
     try:
         data = request.get_json(force=True)
         
+        import smtplib
+        from credentials import aesgcm_encrypt
+
         # Test SMTP connection first
         try:
             smtp = smtplib.SMTP(data['smtp_host'], data['smtp_port'])
@@ -484,7 +355,9 @@ def api_add_smtp_account():
             "smtp_username": data['smtp_username'],
             "encrypted_smtp_password": encrypted_password,
             "imap_host": data.get('imap_host'),
-            "imap_port": data.get('imap_port')
+            "imap_port": data.get('imap_port'),
+            "daily_limit": data.get('daily_limit'),
+            "warmup_start_date": data.get('warmup_start_date')
         }
         
         result = supabase.table("smtp_accounts").insert(account_data).execute()
@@ -513,52 +386,6 @@ def api_get_responded_leads():
     except Exception as e:
         return jsonify({"error": "internal_server_error", "detail": str(e)}), 500
 
-# Update the route to use integer IDs
-@app.route('/track/<lead_id>/<campaign_id>')
-def track_click(lead_id, campaign_id):
-    try:
-        # Get the original URL from query parameters
-        url = request.args.get('url')
-        if not url:
-            return "URL parameter missing", 400
-            
-        # Decode the URL
-        original_url = urllib.parse.unquote(url)
-        
-        # Get the email_queue_id if available
-        email_queue_id = request.args.get('eqid', None)
-        
-        # Convert IDs to integers if possible
-        try:
-            lead_id_int = int(lead_id)
-        except (ValueError, TypeError):
-            lead_id_int = None
-            
-        try:
-            campaign_id_int = int(campaign_id)
-        except (ValueError, TypeError):
-            campaign_id_int = None
-        
-        # Record the click in the database
-        supabase.table("link_clicks").insert({
-            "lead_id": lead_id_int,
-            "campaign_id": campaign_id_int,
-            "url": original_url,
-            "email_queue_id": email_queue_id
-        }).execute()
-        
-        # Redirect to the demo page with lead_id as parameter
-        demo_url = "https://replyzeai.com/goods/templates/demooff"
-        redirect_url = f"{demo_url}?lead_id={lead_id}&campaign_id={campaign_id}"
-        if email_queue_id:
-            redirect_url += f"&eqid={email_queue_id}"
-            
-        return redirect(redirect_url)
-        
-    except Exception as e:
-        print(f"Error tracking click: {str(e)}")
-        return "Error tracking click", 500
-
 @app.route('/api/campaigns/<int:campaign_id>/clicks')
 def api_get_campaign_clicks(campaign_id):
     try:
@@ -585,43 +412,6 @@ def api_get_lead_clicks(lead_id):
     except Exception as e:
         return jsonify({"error": "internal_server_error", "detail": str(e)}), 500
 
-@app.route('/api/track', methods=['GET'])
-def api_track_click():
-    try:
-        lead_id = request.args.get('lead_id')
-        campaign_id = request.args.get('campaign_id')
-        url = request.args.get('url')
-        email_queue_id = request.args.get('eqid', None)
-        
-        if not all([lead_id, campaign_id, url]):
-            return "Missing parameters", 400
-            
-        # Record the click in the database
-        supabase.table("link_clicks").insert({
-            "lead_id": lead_id,
-            "campaign_id": campaign_id,
-            "url": url,
-            "email_queue_id": email_queue_id
-        }).execute()
-        
-        # Redirect to the original URL
-        return redirect(url)
-        
-    except Exception as e:
-        print(f"Error tracking click: {str(e)}")
-        return "Error tracking click", 500
-
-
-
-
-
-        
-# Add to imports at the top of app.py
-# Add these imports at the top of app.py
-import json
-from datetime import datetime, timezone
-from urllib.parse import unquote
-
 # Add these routes to app.py
 
 @app.route('/demo')
@@ -631,118 +421,6 @@ def demo():
                          supabase_anon_key=os.environ['SUPABASE_ANON_KEY'])
 
 
-@app.route('/api/generate-reply-prompt', methods=['OPTIONS', 'POST'])
-def generate_reply_prompt():
-    if request.method == "OPTIONS":
-        # Handle preflight request
-        response = jsonify({"status": "ok"})
-        response.headers.add("Access-Control-Allow-Origin", "https://replyzeai.com")
-        response.headers.add("Access-Control-Allow-Headers", "Content-Type")
-        return response
-
-    data = request.get_json(force=True)
-    prompt = data.get("prompt", "").strip()
-    if not prompt:
-        return jsonify({"error": "Missing prompt"}), 400
-
-    # Enhanced prompt to generate reply and three follow-ups
-    enhanced_prompt = f"""
-    Generate a professional real estate agent reply to the following email, and then generate three follow-up emails that would be sent later.
-    Format your response exactly as follows:
-
-    === REPLY ===
-    [Your main reply here]
-
-    === FOLLOW UP 1 ===
-    [First follow-up email]
-
-    === FOLLOW UP 2 ===
-    [Second follow-up email]
-
-    === FOLLOW UP 3 ===
-    [Third follow-up email]
-
-    Email to respond to:
-    {prompt}
-    """
-
-    try:
-        # Use Groq API instead of GitHub AI models
-        GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
-        if not GROQ_API_KEY:
-            return jsonify({"error": "Groq API key not configured"}), 500
-        
-        # Make request to Groq API
-        response = requests.post(
-            "https://api.groq.com/openai/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {GROQ_API_KEY}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "llama-3.1-8b-instant",  # You can change this to other Groq models
-                "messages": [
-                    {"role": "system", "content": "You are a professional real estate agent. Generate concise, professional responses that help convert leads into appointments."},
-                    {"role": "user", "content": enhanced_prompt}
-                ],
-                "temperature": 0.7,
-                "max_tokens": 1024,
-                "top_p": 0.8
-            },
-            timeout=30
-        )
-        
-        if response.status_code != 200:
-            return jsonify({"error": f"Groq API error: {response.status_code}"}), 500
-        
-        result = response.json()
-        full_response = result["choices"][0]["message"]["content"].strip()
-        
-        # Parse the response to extract reply and follow-ups
-        sections = {}
-        current_section = None
-        lines = full_response.split('\n')
-        
-        for line in lines:
-            line = line.strip()
-            if line == "=== REPLY ===":
-                current_section = 'reply'
-                sections[current_section] = []
-            elif line == "=== FOLLOW UP 1 ===":
-                current_section = 'follow_up_1'
-                sections[current_section] = []
-            elif line == "=== FOLLOW UP 2 ===":
-                current_section = 'follow_up_2'
-                sections[current_section] = []
-            elif line == "=== FOLLOW UP 3 ===":
-                current_section = 'follow_up_3'
-                sections[current_section] = []
-            elif current_section and line:
-                sections[current_section].append(line)
-        
-        # Join the lines for each section
-        reply = ' '.join(sections.get('reply', [])).strip()
-        follow_ups = [
-            ' '.join(sections.get('follow_up_1', [])).strip(),
-            ' '.join(sections.get('follow_up_2', [])).strip(),
-            ' '.join(sections.get('follow_up_3', [])).strip()
-        ]
-        
-        # Remove any empty follow-ups
-        follow_ups = [fu for fu in follow_ups if fu]
-        
-        # Add CORS headers to the response
-        response = jsonify({
-            "reply": reply,
-            "follow_ups": follow_ups
-        })
-        response.headers.add("Access-Control-Allow-Origin", "https://replyzeai.com")
-        return response
-        
-    except Exception as e:
-        print(f"Error generating reply with Groq: {str(e)}")
-        return jsonify({"error": str(e)}), 500
-
 @app.route('/api/record-ai-usage', methods=['POST'])
 def api_record_ai_usage():
     try:
@@ -756,46 +434,12 @@ def api_record_ai_usage():
         try:
             lead_id = int(lead_id)
         except (ValueError, TypeError):
-            pass
-        
-        # Get the lead's email
-        lead = supabase.table("leads") \
-            .select("email") \
-            .eq("id", lead_id) \
-            .single() \
-            .execute()
-        
-        if not lead.data:
             return jsonify({"error": "Lead not found"}), 404
         
-        email = lead.data['email']
-        
-        # Check if we already have a record for this email
-        existing = supabase.table("ai_demo_usage") \
-            .select("*") \
-            .eq("email", email) \
-            .execute()
-        
-        if existing.data:
-            # Update existing record
-            supabase.table("ai_demo_usage") \
-                .update({
-                    "usage_count": existing.data[0]['usage_count'] + 1,
-                    "last_used_at": datetime.now(timezone.utc).isoformat()
-                }) \
-                .eq("email", email) \
-                .execute()
-        else:
-            # Create new record
-            supabase.table("ai_demo_usage") \
-                .insert({
-                    "lead_id": lead_id,
-                    "email": email,
-                    "usage_count": 1,
-                    "first_used_at": datetime.now(timezone.utc).isoformat(),
-                    "last_used_at": datetime.now(timezone.utc).isoformat()
-                }) \
-                .execute()
+        # Counted in memory and flushed in batches by ai_usage.py; unknown
+        # lead ids are dropped at flush time
+        USAGE.record(lead_id)
+        invalidate_lead(lead_id)
         
         return jsonify({"ok": True}), 200
         
@@ -832,14 +476,30 @@ def api_get_lead_ai_usage(lead_id):
             .eq("email", lead.data['email']) \
             .execute()
         
+        usage = with_pending(ai_usage.data[0] if ai_usage.data else None, lead_id, lead.data['email'])
+        
         return jsonify({
             "ok": True, 
-            "ai_usage": ai_usage.data[0] if ai_usage.data else None
+            "ai_usage": usage
         }), 200
         
     except Exception as e:
         return jsonify({"error": "internal_server_error", "detail": str(e)}), 500
 
+@app.route('/api/leads/<int:lead_id>/summary', methods=['GET'])
+def api_get_lead_summary(lead_id):
+    """Lead, clicks, AI usage, queue and reply status in one response"""
+    try:
+        summary, hit = get_summary(lead_id)
+        if summary is None:
+            return jsonify({"error": "Lead not found"}), 404
+        response = jsonify({"ok": True, **summary})
+        response.headers["X-Cache"] = "HIT" if hit else "MISS"
+        return response, 200
+    except Exception as e:
+        app.logger.error("Error in api_get_lead_summary: %s", traceback.format_exc())
+        return jsonify({"error": "internal_server_error", "detail": str(e)}), 500
+
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
@@ -0,0 +1,301 @@
+# benchmarks/fake_supabase.py
+"""
+In-memory stand-in for the parts of the Supabase/PostgREST client this
+repo uses: table().select/insert/upsert/update/delete with the usual
+filters, plus rpc() handlers registered from Python. Every execute() is
+counted and timed, so a benchmark can report DB calls per message and
+subtract the fake's own overhead.
+"""
+import time
+import copy
+import itertools
+
+# Upsert conflict keys when on_conflict isn't given (the table's primary key)
+PRIMARY_KEYS = {
+    "lead_campaign_accounts": ("lead_id", "campaign_id"),
+}
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+        self.count = None
+
+class FakeAPIError(Exception):
+    """Like postgrest's APIError: the PostgREST/Postgres error code in .code"""
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+def _project(row, columns):
+    if columns.strip() == "*":
+        return dict(row)
+    return {c.strip(): row.get(c.strip()) for c in columns.split(",")}
+
+def _sort_key(value):
+    return (value is None, value)
+
+class FakeQuery:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.op = "select"
+        self.columns = "*"
+        self.payload = None
+        self.on_conflict = ""
+        self.filters = []
+        self.signature = []
+        self.id_filter = None
+        self.orders = []
+        self.limit_n = None
+        self.range_ = None
+        self.single_row = False
+        self._negate = False
+
+    # ---------- Operations ----------
+    def select(self, columns="*", count=None):
+        self.op, self.columns = "select", columns
+        return self
+
+    def insert(self, rows, **kwargs):
+        self.op, self.payload = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict="", **kwargs):
+        self.op, self.payload, self.on_conflict = "upsert", rows, on_conflict
+        return self
+
+    def update(self, values, **kwargs):
+        self.op, self.payload = "update", values
+        return self
+
+    def delete(self, **kwargs):
+        self.op = "delete"
+        return self
+
+    # ---------- Filters ----------
+    @property
+    def not_(self):
+        self._negate = True
+        return self
+
+    def _add(self, op, column, value, predicate):
+        negate, self._negate = self._negate, False
+        if negate:
+            self.filters.append((column, lambda v, p=predicate: not p(v)))
+        else:
+            self.filters.append((column, predicate))
+        self.signature.append((negate, op, column, repr(value)))
+        return self
+
+    def eq(self, column, value):
+        if column == "id" and not self._negate and self.id_filter is None:
+            self.id_filter = [value]
+        return self._add("eq", column, value, lambda v: v == value)
+
+    def neq(self, column, value):
+        return self._add("neq", column, value, lambda v: v is not None and v != value)
+
+    def lt(self, column, value):
+        return self._add("lt", column, value, lambda v: v is not None and v < value)
+
+    def lte(self, column, value):
+        return self._add("lte", column, value, lambda v: v is not None and v <= value)
+
+    def gt(self, column, value):
+        return self._add("gt", column, value, lambda v: v is not None and v > value)
+
+    def gte(self, column, value):
+        return self._add("gte", column, value, lambda v: v is not None and v >= value)
+
+    def is_(self, column, value):
+        target = None if value in (None, "null") else value
+        return self._add("is", column, value, lambda v: v is target or v == target)
+
+    def in_(self, column, values):
+        values = set(values)
+        if column == "id" and not self._negate and self.id_filter is None:
+            self.id_filter = list(values)
+        return self._add("in", column, sorted(values, key=repr), lambda v: v in values)
+
+    def match(self, query):
+        for column, value in query.items():
+            self.eq(column, value)
+        return self
+
+    def order(self, column, desc=False, **kwargs):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, n, **kwargs):
+        self.limit_n = n
+        return self
+
+    def range(self, start, end):
+        self.range_ = (start, end)
+        return self
+
+    def single(self):
+        self.single_row = True
+        return self
+
+    # ---------- Execution ----------
+    def _matching(self):
+        if self.id_filter is not None:
+            index = self.db.index(self.table)
+            candidates = [index[i] for i in self.id_filter if i in index]
+        else:
+            candidates = self.db.rows(self.table)
+        return [row for row in candidates if all(p(row.get(c)) for c, p in self.filters)]
+
+    def execute(self):
+        start = time.perf_counter()
+        try:
+            return FakeResponse(getattr(self, f"_execute_{self.op}")())
+        finally:
+            self.db.calls += 1
+            self.db.calls_by_table[self.table] = self.db.calls_by_table.get(self.table, 0) + 1
+            self.db.seconds += time.perf_counter() - start
+
+    def _execute_select(self):
+        # Paging through one result set (.range) re-runs the same query;
+        # reuse the filtered, sorted rows while the table is unchanged
+        key = (self.table, tuple(self.signature), tuple(self.orders))
+        cached = self.db.query_cache.get(key)
+        if cached and cached[0] == self.db.version(self.table):
+            rows = cached[1]
+        else:
+            rows = self._matching()
+            for column, desc in reversed(self.orders):
+                rows.sort(key=lambda r: _sort_key(r.get(column)), reverse=desc)
+            if self.range_:
+                self.db.query_cache[key] = (self.db.version(self.table), rows)
+        if self.range_:
+            rows = rows[self.range_[0]:self.range_[1] + 1]
+        if self.limit_n is not None:
+            rows = rows[:self.limit_n]
+        data = [_project(r, self.columns) for r in rows]
+        if self.single_row:
+            if len(data) != 1:
+                raise FakeAPIError(f"expected one row from {self.table}, got {len(data)}", code="PGRST116")
+            return data[0]
+        return data
+
+    def _execute_insert(self):
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        return [dict(self.db.insert_row(self.table, row)) for row in rows]
+
+    def _execute_upsert(self):
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        keys = tuple(c.strip() for c in self.on_conflict.split(",") if c.strip()) \
+            or PRIMARY_KEYS.get(self.table, ("id",))
+        return [dict(self.db.upsert_row(self.table, row, keys)) for row in rows]
+
+    def _execute_update(self):
+        rows = self._matching()
+        for row in rows:
+            row.update(copy.deepcopy(self.payload))
+        self.db.touch(self.table)
+        return [dict(r) for r in rows]
+
+    def _execute_delete(self):
+        doomed = self._matching()
+        self.db.delete_rows(self.table, doomed)
+        return [dict(r) for r in doomed]
+
+class FakeRPC:
+    def __init__(self, db, name, params):
+        self.db, self.name, self.params = db, name, params
+
+    def execute(self):
+        start = time.perf_counter()
+        try:
+            handler = self.db.rpc_handlers.get(self.name)
+            if handler is None:
+                raise FakeAPIError(f"function {self.name} does not exist", code="PGRST202")
+            return FakeResponse(handler(self.db, **self.params))
+        finally:
+            self.db.calls += 1
+            self.db.calls_by_table[f"rpc:{self.name}"] = self.db.calls_by_table.get(f"rpc:{self.name}", 0) + 1
+            self.db.seconds += time.perf_counter() - start
+
+class FakeSupabase:
+    """Drop-in for the Supabase client: assign it to db._client"""
+
+    def __init__(self):
+        self._tables = {}
+        self._indexes = {}
+        self._unique = {}
+        self._ids = {}
+        self._versions = {}
+        self.query_cache = {}
+        self.rpc_handlers = {}
+        self.calls = 0
+        self.calls_by_table = {}
+        self.seconds = 0.0
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def from_(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params=None):
+        return FakeRPC(self, name, params or {})
+
+    # ---------- Storage ----------
+    def rows(self, table):
+        return self._tables.setdefault(table, [])
+
+    def index(self, table):
+        return self._indexes.setdefault(table, {})
+
+    def version(self, table):
+        return self._versions.get(table, 0)
+
+    def touch(self, table):
+        self._versions[table] = self.version(table) + 1
+
+    def insert_row(self, table, row):
+        row = copy.deepcopy(row)
+        if row.get("id") is None:
+            row["id"] = next(self._ids.setdefault(table, itertools.count(1)))
+        self.rows(table).append(row)
+        self.index(table)[row["id"]] = row
+        self.touch(table)
+        for keys, unique in self._unique.get(table, {}).items():
+            unique[tuple(row.get(k) for k in keys)] = row
+        return row
+
+    def upsert_row(self, table, row, keys):
+        unique = self._unique.setdefault(table, {}).get(keys)
+        if unique is None:
+            unique = {tuple(r.get(k) for k in keys): r for r in self.rows(table)}
+            self._unique[table][keys] = unique
+        existing = unique.get(tuple(row.get(k) for k in keys))
+        if existing is not None:
+            existing.update(copy.deepcopy(row))
+            self.touch(table)
+            return existing
+        return self.insert_row(table, row)
+
+    def delete_rows(self, table, doomed):
+        doomed_ids = {id(r) for r in doomed}
+        self._tables[table] = [r for r in self.rows(table) if id(r) not in doomed_ids]
+        self.touch(table)
+        index = self.index(table)
+        for row in doomed:
+            index.pop(row.get("id"), None)
+        for unique in self._unique.get(table, {}).values():
+            for key in [k for k, r in unique.items() if id(r) in doomed_ids]:
+                del unique[key]
+
+    def seed(self, table, rows):
+        """Load rows without counting them as calls"""
+        for row in rows:
+            self.insert_row(table, row)
+
+    def reset_counters(self):
+        self.calls = 0
+        self.calls_by_table = {}
+        self.seconds = 0.0
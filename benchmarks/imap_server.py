@@ -0,0 +1,441 @@
+# benchmarks/imap_server.py
+"""
+In-process IMAP server (implicit TLS, self-signed) serving synthetic
+inboxes, for benchmarking check_replies.py. It implements the subset of
+IMAP4rev1 imaplib and the reply checker use: CAPABILITY, LOGIN, SELECT,
+EXAMINE, SEARCH, FETCH, STORE, the UID variants, NOOP, IDLE, CLOSE and
+LOGOUT. Bytes and commands are counted per login so a benchmark can
+report them per account.
+
+Messages are stored as (header bytes, body bytes); the body object can be
+shared between messages so large inboxes with attachments stay cheap.
+"""
+import re
+import shlex
+import random
+import threading
+import socketserver
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+from smtp_sink import self_signed_context
+
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+FETCH_ITEM_RE = re.compile(
+    r'BODY(?:\.PEEK)?\[[^\]]*\](?:<[\d.]+>)?|RFC822(?:\.HEADER|\.SIZE|\.TEXT)?|FLAGS|UID|INTERNALDATE|ENVELOPE',
+    re.IGNORECASE
+)
+
+class Message:
+    __slots__ = ("uid", "head", "body", "date", "flags")
+
+    def __init__(self, uid, head, body, date, flags=()):
+        self.uid = uid
+        self.head = head
+        self.body = body
+        self.date = date
+        self.flags = set(flags)
+
+    @property
+    def raw(self):
+        return self.head + self.body
+
+    def header_fields(self, names, exclude=False):
+        """Header lines (with continuations) whose name is in names"""
+        wanted = {n.lower() for n in names}
+        out, keep = [], False
+        for line in self.head.split(b"\r\n"):
+            if line[:1] in (b" ", b"\t"):
+                if keep:
+                    out.append(line)
+                continue
+            name = line.split(b":", 1)[0].decode("ascii", "replace").strip().lower()
+            keep = bool(line) and ((name in wanted) != exclude)
+            if keep:
+                out.append(line)
+        return b"\r\n".join(out) + b"\r\n\r\n"
+
+class Mailbox:
+    def __init__(self):
+        self.messages = []
+
+    def append(self, head, body, date=None, flags=()):
+        date = date or datetime.now(timezone.utc)
+        self.messages.append(Message(len(self.messages) + 1, head, body, date, flags))
+
+class AccountStats:
+    def __init__(self):
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.commands = {}
+        self.connections = 0
+
+    @property
+    def total_commands(self):
+        return sum(self.commands.values())
+
+    def as_dict(self):
+        return {
+            "connections": self.connections,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "commands": dict(sorted(self.commands.items())),
+            "total_commands": self.total_commands,
+        }
+
+def _parse_sequence(spec, messages, by_uid):
+    """Messages selected by a sequence set like '1:5,9,12:*'"""
+    if not messages:
+        return []
+    top = messages[-1].uid if by_uid else len(messages)
+    wanted = set()
+    for part in spec.split(","):
+        lo, _, hi = part.partition(":")
+        lo = top if lo == "*" else int(lo)
+        hi = lo if not hi else top if hi == "*" else int(hi)
+        wanted.update(range(min(lo, hi), max(lo, hi) + 1))
+    if by_uid:
+        return [(i + 1, m) for i, m in enumerate(messages) if m.uid in wanted]
+    return [(n, messages[n - 1]) for n in sorted(wanted) if 1 <= n <= len(messages)]
+
+def _parse_date(value):
+    day, month, year = value.strip('"').split("-")
+    return datetime(int(year), MONTHS.index(month.title()) + 1, int(day), tzinfo=timezone.utc).date()
+
+class _IMAPHandler(socketserver.StreamRequestHandler):
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        self.request = self.server.tls.wrap_socket(self.request, server_side=True)
+        super().setup()
+        self.stats = AccountStats()
+        self.mailbox = None
+        self.readonly = False
+
+    # ---------- Wire ----------
+    def send(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.stats.bytes_out += len(data)
+        self.wfile.write(data)
+
+    def line(self, text):
+        self.send(text + "\r\n")
+
+    def flush(self):
+        if self.server.latency:
+            self.server.sleep(self.server.latency)
+        self.wfile.flush()
+
+    def readline(self):
+        data = self.rfile.readline()
+        self.stats.bytes_in += len(data)
+        return data
+
+    def handle(self):
+        self.line("* OK [CAPABILITY IMAP4rev1 IDLE] benchmark IMAP ready")
+        self.flush()
+        while True:
+            raw = self.readline()
+            if not raw:
+                return
+            parts = raw.decode("utf-8", "replace").rstrip("\r\n").split(" ", 2)
+            if len(parts) < 2:
+                self.line("* BAD malformed command")
+                self.flush()
+                continue
+            tag, verb = parts[0], parts[1].upper()
+            args = parts[2] if len(parts) > 2 else ""
+            self.stats.commands[verb] = self.stats.commands.get(verb, 0) + 1
+
+            handler = getattr(self, f"cmd_{verb.lower()}", None)
+            if handler is None:
+                self.line(f"{tag} BAD unknown command {verb}")
+            else:
+                try:
+                    if handler(tag, args) is False:
+                        self.flush()
+                        return
+                except Exception as e:
+                    self.line(f"{tag} BAD {e}")
+            self.flush()
+
+    # ---------- Commands ----------
+    def cmd_capability(self, tag, args):
+        self.line("* CAPABILITY IMAP4rev1 IDLE")
+        self.line(f"{tag} OK CAPABILITY completed")
+
+    def cmd_noop(self, tag, args):
+        self.line(f"{tag} OK NOOP completed")
+
+    def cmd_login(self, tag, args):
+        user = shlex.split(args)[0]
+        self.mailbox = self.server.mailboxes.get(user)
+        if self.mailbox is None:
+            self.line(f"{tag} NO [AUTHENTICATIONFAILED] unknown user")
+            return
+        self.stats = self.server.stats_for(user, self.stats)
+        self.stats.connections += 1
+        self.line(f"{tag} OK LOGIN completed")
+
+    def cmd_select(self, tag, args, readonly=False):
+        if self.mailbox is None:
+            self.line(f"{tag} NO not authenticated")
+            return
+        self.readonly = readonly
+        messages = self.mailbox.messages
+        unseen = next((i + 1 for i, m in enumerate(messages) if "\\Seen" not in m.flags), None)
+        self.line(f"* {len(messages)} EXISTS")
+        self.line("* 0 RECENT")
+        if unseen:
+            self.line(f"* OK [UNSEEN {unseen}]")
+        self.line("* FLAGS (\\Answered \\Flagged \\Deleted \\Seen \\Draft)")
+        self.line("* OK [UIDVALIDITY 1]")
+        self.line(f"* OK [UIDNEXT {len(messages) + 1}]")
+        self.line(f"{tag} OK [{'READ-ONLY' if readonly else 'READ-WRITE'}] SELECT completed")
+
+    def cmd_examine(self, tag, args):
+        self.cmd_select(tag, args, readonly=True)
+
+    def cmd_search(self, tag, args, by_uid=False):
+        tokens = shlex.split(args)
+        if tokens and tokens[0].upper() == "CHARSET":
+            tokens = tokens[2:]
+        tokens = [t.strip("()") for t in tokens]
+        messages = self.mailbox.messages
+        matched = []
+        for n, m in enumerate(messages, 1):
+            ok = True
+            i = 0
+            while i < len(tokens):
+                key = tokens[i].upper()
+                if key in ("", "ALL"):
+                    pass
+                elif key == "UNSEEN":
+                    ok = ok and "\\Seen" not in m.flags
+                elif key == "SEEN":
+                    ok = ok and "\\Seen" in m.flags
+                elif key == "SINCE":
+                    i += 1
+                    ok = ok and m.date.date() >= _parse_date(tokens[i])
+                elif key == "BEFORE":
+                    i += 1
+                    ok = ok and m.date.date() < _parse_date(tokens[i])
+                elif key == "UID":
+                    i += 1
+                    ok = ok and any(x is m for _, x in _parse_sequence(tokens[i], messages, True))
+                else:
+                    raise ValueError(f"unsupported search key {key}")
+                i += 1
+            if ok:
+                matched.append(m.uid if by_uid else n)
+        self.line("* SEARCH" + "".join(f" {n}" for n in matched))
+        self.line(f"{tag} OK SEARCH completed")
+
+    def cmd_fetch(self, tag, args, by_uid=False):
+        spec, _, items = args.partition(" ")
+        wanted = [item.upper() for item in FETCH_ITEM_RE.findall(items)]
+        if by_uid and "UID" not in wanted:
+            wanted.insert(0, "UID")
+        for n, m in _parse_sequence(spec, self.mailbox.messages, by_uid):
+            self.send(f"* {n} FETCH (")
+            first = True
+            for item in wanted:
+                value = self._fetch_item(m, item)
+                self.send(("" if first else " ") + item.replace(".PEEK", "") + " ")
+                if isinstance(value, bytes):
+                    self.send(f"{{{len(value)}}}\r\n")
+                    self.send(value)
+                else:
+                    self.send(value)
+                first = False
+            self.send(")\r\n")
+        self.line(f"{tag} OK FETCH completed")
+
+    def _fetch_item(self, m, item):
+        marks_seen = not self.readonly and ".PEEK" not in item
+        if item in ("RFC822", "BODY[]"):
+            if marks_seen:
+                m.flags.add("\\Seen")
+            return m.raw
+        if item == "RFC822.HEADER" or item.startswith("BODY.PEEK[HEADER]") or item == "BODY[HEADER]":
+            return m.head
+        if item == "RFC822.TEXT" or item.endswith("[TEXT]"):
+            if marks_seen:
+                m.flags.add("\\Seen")
+            return m.body
+        if "HEADER.FIELDS" in item:
+            names = item[item.index("(") + 1:item.index(")")].split()
+            return m.header_fields(names, exclude="NOT" in item)
+        if item == "RFC822.SIZE":
+            return str(len(m.head) + len(m.body))
+        if item == "FLAGS":
+            return "(" + " ".join(sorted(m.flags)) + ")"
+        if item == "UID":
+            return str(m.uid)
+        if item == "INTERNALDATE":
+            return '"' + m.date.strftime("%d-") + MONTHS[m.date.month - 1] + m.date.strftime("-%Y %H:%M:%S +0000") + '"'
+        raise ValueError(f"unsupported fetch item {item}")
+
+    def cmd_store(self, tag, args, by_uid=False):
+        spec, op, flags = args.split(" ", 2)
+        flags = set(flags.strip("()").split())
+        for n, m in _parse_sequence(spec, self.mailbox.messages, by_uid):
+            if op.upper().startswith("+"):
+                m.flags |= flags
+            elif op.upper().startswith("-"):
+                m.flags -= flags
+            else:
+                m.flags = set(flags)
+            if ".SILENT" not in op.upper():
+                self.line(f"* {n} FETCH (FLAGS ({' '.join(sorted(m.flags))}))")
+        self.line(f"{tag} OK STORE completed")
+
+    def cmd_uid(self, tag, args):
+        verb, _, rest = args.partition(" ")
+        handler = {"FETCH": self.cmd_fetch, "SEARCH": self.cmd_search, "STORE": self.cmd_store}.get(verb.upper())
+        if handler is None:
+            self.line(f"{tag} BAD unsupported UID {verb}")
+            return
+        handler(tag, rest, by_uid=True)
+
+    def cmd_idle(self, tag, args):
+        self.line("+ idling")
+        self.flush()
+        while True:
+            data = self.readline()
+            if not data or data.strip().upper() == b"DONE":
+                break
+        self.line(f"{tag} OK IDLE terminated")
+
+    def cmd_close(self, tag, args):
+        self.line(f"{tag} OK CLOSE completed")
+
+    def cmd_logout(self, tag, args):
+        self.line("* BYE logging out")
+        self.line(f"{tag} OK LOGOUT completed")
+        return False
+
+class IMAPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        super().__init__((host, port), _IMAPHandler)
+        self.latency = latency
+        self.tls = self_signed_context()
+        self.mailboxes = {}
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def sleep(seconds):
+        threading.Event().wait(seconds)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def mailbox(self, user):
+        return self.mailboxes.setdefault(user, Mailbox())
+
+    def stats_for(self, user, pre_login):
+        """Per-user stats, folding in what the connection did before LOGIN"""
+        with self._stats_lock:
+            stats = self.stats.setdefault(user, AccountStats())
+            stats.bytes_in += pre_login.bytes_in
+            stats.bytes_out += pre_login.bytes_out
+            for verb, count in pre_login.commands.items():
+                stats.commands[verb] = stats.commands.get(verb, 0) + count
+        return stats
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+# ---------- Synthetic inboxes ----------
+def _head(headers):
+    return "".join(f"{k}: {v}\r\n" for k, v in headers).encode("utf-8") + b"\r\n"
+
+def _plain_body(text):
+    return text.replace("\n", "\r\n").encode("utf-8")
+
+_ATTACHMENTS = {}
+
+def _attachment_body(size):
+    """multipart/mixed body with a base64 attachment of ~size bytes (shared)"""
+    if size not in _ATTACHMENTS:
+        import base64
+        payload = base64.encodebytes(random.Random(size).randbytes(size)).replace(b"\n", b"\r\n")
+        _ATTACHMENTS[size] = (
+            b"--b1\r\nContent-Type: text/plain; charset=utf-8\r\n\r\n"
+            b"Thanks, details attached.\r\n"
+            b"--b1\r\nContent-Type: application/pdf; name=\"listing.pdf\"\r\n"
+            b"Content-Transfer-Encoding: base64\r\n"
+            b"Content-Disposition: attachment; filename=\"listing.pdf\"\r\n\r\n"
+            + payload +
+            b"--b1--\r\n"
+        )
+    return _ATTACHMENTS[size]
+
+_ALTERNATIVE = (
+    b"--a1\r\nContent-Type: text/plain; charset=utf-8\r\n\r\n"
+    b"Sounds good, let's talk next week.\r\n"
+    b"--a1\r\nContent-Type: text/html; charset=utf-8\r\n\r\n"
+    b"<p>Sounds good, let's talk <b>next week</b>.</p>\r\n"
+    b"--a1--\r\n"
+)
+
+def seed_inbox(mailbox, count, account_email, sent, reply_rate=0.05, legacy_rate=0.2,
+               multipart_rate=0.3, attachment_rate=0.01, attachment_size=1024 * 1024,
+               unseen_rate=0.5, days=3, seed=1):
+    """
+    Fill a mailbox with `count` messages spread over the last `days` days.
+    `sent` is a list of (lead_email, message_id) we sent from this account;
+    a reply_rate share of messages reply to them (legacy_rate of those as
+    bare "Re:" mail without In-Reply-To). The rest are newsletters and other
+    unrelated mail. Returns the set of lead emails that replied.
+    """
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    replied = set()
+
+    for i in range(count):
+        date = now - timedelta(seconds=rng.uniform(0, days * 86400))
+        flags = () if rng.random() < unseen_rate else ("\\Seen",)
+        headers = [("Date", format_datetime(date)), ("To", account_email),
+                   ("Message-ID", f"<in{i}.{seed}@mail.example.net>")]
+
+        if sent and rng.random() < reply_rate:
+            lead_email, message_id = rng.choice(sent)
+            headers += [("From", f"Lead <{lead_email}>"), ("Subject", "Re: Quick question")]
+            if rng.random() >= legacy_rate:
+                headers += [("In-Reply-To", message_id), ("References", message_id)]
+            # What check_replies can see: unseen, within its SINCE window
+            if "\\Seen" not in flags and date.date() >= (now - timedelta(days=1)).date():
+                replied.add(lead_email)
+        else:
+            headers += [("From", f"News <news{rng.randrange(50)}@list.example.org>"),
+                        ("Subject", f"Weekly market update #{i}")]
+
+        if rng.random() < attachment_rate:
+            headers += [("MIME-Version", "1.0"), ("Content-Type", 'multipart/mixed; boundary="b1"')]
+            body = _attachment_body(attachment_size)
+        elif rng.random() < multipart_rate:
+            headers += [("MIME-Version", "1.0"), ("Content-Type", 'multipart/alternative; boundary="a1"')]
+            body = _ALTERNATIVE
+        else:
+            headers += [("Content-Type", "text/plain; charset=utf-8")]
+            body = _plain_body(f"Message {i}\nNothing to see here.\n")
+
+        mailbox.append(_head(headers), body, date, flags)
+
+    mailbox.messages.sort(key=lambda m: m.date)
+    for uid, m in enumerate(mailbox.messages, 1):
+        m.uid = uid
+    return replied
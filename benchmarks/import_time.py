@@ -0,0 +1,49 @@
+# benchmarks/import_time.py
+"""
+Measure cold import time of each entry point and fail if one exceeds its
+budget. Each module is imported in a fresh interpreter with -X importtime.
+
+    python benchmarks/import_time.py
+"""
+import os
+import sys
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Budgets in milliseconds of cumulative import time
+BUDGETS_MS = {
+    "api.track": 250,
+    "api.generate_reply_prompt": 250,
+    "app": 600,
+}
+
+def import_time_ms(module):
+    """Cumulative import time of module, as reported by -X importtime"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr[-2000:]}")
+
+    for line in result.stderr.splitlines():
+        # "import time:      self [us] | cumulative | imported package"
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1000
+    raise RuntimeError(f"no import timing found for {module}")
+
+def main():
+    failed = False
+    for module, budget in BUDGETS_MS.items():
+        elapsed = min(import_time_ms(module) for _ in range(3))
+        status = "ok" if elapsed <= budget else "OVER BUDGET"
+        failed = failed or elapsed > budget
+        print(f"{module:30s} {elapsed:8.1f} ms  (budget {budget} ms)  {status}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+# benchmarks/reply_detection.py
+"""
+Run check_replies.check_for_replies against the in-process IMAP server
+(imap_server.py) and the in-memory Supabase (fake_supabase.py), with
+synthetic inboxes of replies, unrelated mail, multipart bodies and large
+attachments. Reports wall time, bytes transferred and IMAP commands per
+account, DB calls, and whether every visible reply was matched.
+
+    python benchmarks/reply_detection.py
+    python benchmarks/reply_detection.py --messages 50000 --accounts 3 --latency-ms 20
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+DEFAULT_MESSAGES = [1000, 10000, 50000]
+
+def mark_leads_responded_handler(db, p_lead_ids):
+    """Python equivalent of sql/002's mark_leads_responded over the fake tables"""
+    ids = set(p_lead_ids)
+    now = datetime.now(timezone.utc).isoformat()
+    for lead in db.rows("leads"):
+        if lead["id"] in ids:
+            db.insert_row("responded_leads", {
+                "original_lead_id": lead["id"], "email": lead["email"], "name": lead["name"],
+            })
+            lead.update({"responded": True, "responded_at": now})
+    db.delete_rows("email_queue", [q for q in db.rows("email_queue")
+                                   if q["lead_id"] in ids and q.get("sent_at") is None])
+    db.delete_rows("lead_campaign_accounts", [a for a in db.rows("lead_campaign_accounts")
+                                              if a["lead_id"] in ids])
+    db.touch("leads")
+    return None
+
+def seed(fake, server, accounts, messages, leads_per_account, args):
+    from credentials import aesgcm_encrypt
+    from worker import make_message_id
+
+    password = aesgcm_encrypt("benchmark")
+    sent_at = (datetime.now(timezone.utc) - timedelta(days=2)).isoformat()
+    expected = set()
+    lead_id = 0
+    eq_id = 0
+
+    for a in range(accounts):
+        account_email = f"sender{a}@bench.test"
+        fake.seed("smtp_accounts", [{
+            "id": a + 1,
+            "email": account_email,
+            "display_name": f"Sender {a}",
+            "smtp_username": account_email,
+            "encrypted_smtp_password": password,
+            "imap_host": "127.0.0.1",
+            "imap_port": server.port,
+        }])
+
+        sent = []
+        for _ in range(leads_per_account):
+            lead_id += 1
+            eq_id += 1
+            lead_email = f"lead{lead_id}@example.com"
+            message_id = make_message_id(eq_id, account_email)
+            fake.seed("leads", [{"id": lead_id, "email": lead_email, "name": f"Lead {lead_id}",
+                                 "responded": False}])
+            fake.seed("email_queue", [{
+                "id": eq_id, "campaign_id": 1, "lead_id": lead_id, "lead_email": lead_email,
+                "sequence": 0, "sent_at": sent_at, "sent_from": account_email,
+                "message_id": message_id, "status": "queued",
+            }])
+            sent.append((lead_email, message_id))
+
+        from imap_server import seed_inbox
+        expected |= seed_inbox(
+            server.mailbox(account_email), messages, account_email, sent,
+            reply_rate=args.reply_rate, attachment_rate=args.attachment_rate,
+            attachment_size=args.attachment_kb * 1024, seed=a + 1,
+        )
+    return expected
+
+def run(messages, args):
+    os.environ.setdefault("ENCRYPTION_KEY", os.urandom(32).hex())
+    import db
+    import check_replies
+    from fake_supabase import FakeSupabase
+    from imap_server import IMAPServer
+
+    server = IMAPServer(latency=args.latency_ms / 1000).start()
+    fake = FakeSupabase()
+    db._client = fake
+    if not args.no_rpc:
+        fake.rpc_handlers["mark_leads_responded"] = mark_leads_responded_handler
+
+    expected = seed(fake, server, args.accounts, messages, args.leads_per_account, args)
+    fake.reset_counters()
+
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        check_replies.check_for_replies()
+    elapsed = time.perf_counter() - start
+    server.stop()
+
+    responded = {lead["email"] for lead in fake.rows("leads") if lead.get("responded")}
+    per_account = {user: stats.as_dict() for user, stats in sorted(server.stats.items())}
+    return {
+        "messages_per_account": messages,
+        "accounts": args.accounts,
+        "seconds": round(elapsed, 3),
+        "bytes_out": sum(s["bytes_out"] for s in per_account.values()),
+        "bytes_in": sum(s["bytes_in"] for s in per_account.values()),
+        "imap_commands": sum(s["total_commands"] for s in per_account.values()),
+        "db_calls": fake.calls,
+        "replies_expected": len(expected),
+        "replies_matched": len(responded & expected),
+        "false_positives": len(responded - expected),
+        "per_account": per_account,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, nargs="+", default=DEFAULT_MESSAGES,
+                        help="inbox sizes (messages per account) to run")
+    parser.add_argument("--accounts", type=int, default=2)
+    parser.add_argument("--leads-per-account", type=int, default=1000)
+    parser.add_argument("--reply-rate", type=float, default=0.05)
+    parser.add_argument("--attachment-rate", type=float, default=0.01)
+    parser.add_argument("--attachment-kb", type=int, default=1024)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay before every IMAP response")
+    parser.add_argument("--no-rpc", action="store_true",
+                        help="leave mark_leads_responded undefined so the bulk-write fallback runs")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for messages in args.messages:
+        r = run(messages, args)
+        results.append(r)
+        if args.json:
+            continue
+        print(f"{messages} messages x {r['accounts']} accounts: {r['seconds']:.2f} s, "
+              f"{r['bytes_out'] / 1e6:.1f} MB down, {r['bytes_in'] / 1e3:.1f} kB up, "
+              f"{r['imap_commands']} IMAP commands, {r['db_calls']} DB calls, "
+              f"{r['replies_matched']}/{r['replies_expected']} replies matched, "
+              f"{r['false_positives']} false positives")
+        for user, s in r["per_account"].items():
+            commands = " ".join(f"{verb}={count}" for verb, count in s["commands"].items())
+            print(f"    {user:24s} {s['bytes_out'] / 1e6:8.1f} MB  {s['total_commands']:6d} cmds  {commands}")
+    if args.json:
+        print(json.dumps(results, indent=2))
+    return 0 if all(r["replies_matched"] == r["replies_expected"] for r in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+# benchmarks/send_throughput.py
+"""
+End-to-end throughput of worker.send_queued against local stand-ins: an
+in-memory Supabase (fake_supabase.py) and an SMTP sink with configurable
+reply latency (smtp_sink.py). For each queue size the worker is run
+repeatedly, as the cron job would, until the queue is drained.
+
+Each size runs in a fresh interpreter so peak RSS is per size. Reported:
+messages/sec (wall clock, and excluding time spent inside the fake DB),
+DB calls per message and peak memory.
+
+    python benchmarks/send_throughput.py
+    python benchmarks/send_throughput.py --sizes 100 1000 --smtp-latency-ms 20
+    python benchmarks/send_throughput.py --no-rpc   # Python claim fallback
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+
+BODY = (
+    "<p>Hi {name},</p>\n"
+    "<p>Saw your listing on <a href=\"https://example.com/listings/{i}\">example.com</a>.</p>\n"
+    "<p>Book a call: <a href=\"https://calendly.com/demo\">calendly.com/demo</a> "
+    "or reply to <a href=\"mailto:sales@example.com\">sales@example.com</a>.</p>"
+)
+
+def claim_due_emails_handler(worker):
+    """Python equivalent of sql/006_claim_due_emails.sql over the fake tables"""
+    def handler(db, p_capacity, p_limit=100):
+        now = datetime.now(timezone.utc).isoformat()
+        assigned = {(a["lead_id"], a["campaign_id"]): a["smtp_account"]
+                    for a in db.rows("lead_campaign_accounts")}
+        priorities = {c["id"]: c.get("priority") or 0 for c in db.rows("campaigns")}
+        due = []
+        for q in db.rows("email_queue"):
+            if q.get("sent_at") is not None or q.get("status") != "queued" or q["scheduled_for"] > now:
+                continue
+            row = dict(q)
+            row["assigned_account"] = assigned.get((q["lead_id"], q["campaign_id"]))
+            row["priority"] = priorities.get(q["campaign_id"], 0)
+            if row["assigned_account"] and p_capacity.get(row["assigned_account"], 0) <= 0:
+                continue
+            due.append(row)
+        return worker._fair_order(due, p_capacity, p_limit)
+    return handler
+
+def seed(fake, size, accounts, campaigns, smtp_port):
+    from credentials import aesgcm_encrypt
+
+    password = aesgcm_encrypt("benchmark")
+    fake.seed("smtp_accounts", [{
+        "id": i + 1,
+        "email": f"sender{i}@bench.test",
+        "display_name": f"Sender {i}",
+        "smtp_host": "127.0.0.1",
+        "smtp_port": smtp_port,
+        "smtp_username": f"sender{i}@bench.test",
+        "encrypted_smtp_password": password,
+        # Large enough that the token bucket never throttles the run
+        "daily_limit": size,
+        "warmup_start_date": None,
+    } for i in range(accounts)])
+    fake.seed("campaigns", [{"id": c + 1, "name": f"Campaign {c}", "priority": 0} for c in range(campaigns)])
+    fake.seed("campaign_followups", [{
+        "id": c + 1,
+        "campaign_id": c + 1,
+        "sequence": 1,
+        "days_after_previous": 3,
+        "subject": "Following up, {name}",
+        "body": "Hi {name},\n\nJust bumping this in {city}.\n\nThanks",
+    } for c in range(campaigns)])
+    fake.seed("leads", [{
+        "id": i + 1,
+        "name": f"Lead {i}",
+        "email": f"lead{i}@example.com",
+        "city": "Austin",
+        "ai_hooks": None,
+    } for i in range(size)])
+
+    scheduled = (datetime.now(timezone.utc) - timedelta(minutes=5)).isoformat()
+    fake.seed("email_queue", [{
+        "id": i + 1,
+        "campaign_id": i % campaigns + 1,
+        "lead_id": i + 1,
+        "lead_email": f"lead{i}@example.com",
+        "subject": f"Quick question, Lead {i}",
+        "body": BODY.format(name=f"Lead {i}", i=i),
+        "sequence": 0,
+        "scheduled_for": scheduled,
+        "sent_at": None,
+        "status": "queued",
+        "attempts": 0,
+    } for i in range(size)])
+    # Present for parity with production; the token bucket no longer reads it
+    fake.seed("daily_email_counts", [])
+    fake.seed("lead_campaign_accounts", [])
+
+def run_size(size, accounts, campaigns, smtp_latency, use_rpc):
+    """Drain a queue of `size` emails; runs inside the child interpreter"""
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, HERE)
+    os.environ.setdefault("ENCRYPTION_KEY", os.urandom(32).hex())
+
+    import db
+    import worker
+    from fake_supabase import FakeSupabase
+    from smtp_sink import SMTPSink
+
+    sink = SMTPSink(latency=smtp_latency).start()
+    fake = FakeSupabase()
+    db._client = fake
+    if use_rpc:
+        fake.rpc_handlers["claim_due_emails"] = claim_due_emails_handler(worker)
+    seed(fake, size, accounts, campaigns, sink.port)
+    fake.reset_counters()
+
+    runs = 0
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        while sink.messages < size:
+            before = sink.messages
+            worker.send_queued()
+            runs += 1
+            if sink.messages == before:
+                break
+    elapsed = time.perf_counter() - start
+    sink.stop()
+
+    sent = sink.messages
+    return {
+        "size": size,
+        "sent": sent,
+        "runs": runs,
+        "seconds": round(elapsed, 3),
+        "msgs_per_sec": round(sent / elapsed, 1) if elapsed else 0.0,
+        "msgs_per_sec_excl_db": round(sent / (elapsed - fake.seconds), 1) if elapsed > fake.seconds else 0.0,
+        "db_calls": fake.calls,
+        "db_calls_per_msg": round(fake.calls / sent, 2) if sent else 0.0,
+        "db_calls_by_table": fake.calls_by_table,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+def run_child(args, size):
+    command = [
+        sys.executable, os.path.abspath(__file__), "--child", str(size),
+        "--accounts", str(args.accounts),
+        "--campaigns", str(args.campaigns),
+        "--smtp-latency-ms", str(args.smtp_latency_ms),
+    ]
+    if args.no_rpc:
+        command.append("--no-rpc")
+    result = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"size {size} failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--accounts", type=int, default=5)
+    parser.add_argument("--campaigns", type=int, default=3)
+    parser.add_argument("--smtp-latency-ms", type=float, default=0.0,
+                        help="delay before every SMTP reply")
+    parser.add_argument("--no-rpc", action="store_true",
+                        help="leave claim_due_emails undefined so the worker selects in Python")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_size(args.child, args.accounts, args.campaigns,
+                                  args.smtp_latency_ms / 1000, not args.no_rpc)))
+        return 0
+
+    results = []
+    if not args.json:
+        print(f"{'size':>8} {'sent':>8} {'runs':>6} {'seconds':>9} {'msg/s':>9} {'msg/s*':>9} {'calls/msg':>10} {'peak MB':>8}")
+    for size in args.sizes:
+        r = run_child(args, size)
+        results.append(r)
+        if not args.json:
+            print(f"{r['size']:>8} {r['sent']:>8} {r['runs']:>6} {r['seconds']:>9.2f} {r['msgs_per_sec']:>9.1f} "
+                  f"{r['msgs_per_sec_excl_db']:>9.1f} {r['db_calls_per_msg']:>10.2f} {r['peak_rss_mb']:>8.1f}")
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print("msg/s* excludes time spent inside the in-memory Supabase stand-in")
+    return 0 if all(r["sent"] == r["size"] for r in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
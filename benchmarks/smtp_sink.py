@@ -0,0 +1,133 @@
+# benchmarks/smtp_sink.py
+"""
+Local SMTP server that accepts and discards mail. It speaks enough of
+RFC 5321 for smtplib: EHLO, STARTTLS (self-signed certificate), AUTH
+PLAIN/LOGIN, MAIL, RCPT, DATA, RSET, NOOP and QUIT. `latency` seconds are
+added before every reply to simulate a remote server.
+"""
+import os
+import ssl
+import time
+import tempfile
+import threading
+import socketserver
+from datetime import datetime, timedelta, timezone
+
+def self_signed_context():
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.now(timezone.utc)
+    cert = x509.CertificateBuilder() \
+        .subject_name(name) \
+        .issuer_name(name) \
+        .public_key(key.public_key()) \
+        .serial_number(x509.random_serial_number()) \
+        .not_valid_before(now - timedelta(days=1)) \
+        .not_valid_after(now + timedelta(days=1)) \
+        .sign(key, hashes.SHA256())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cert_path = os.path.join(tmp, "cert.pem")
+        key_path = os.path.join(tmp, "key.pem")
+        with open(cert_path, "wb") as f:
+            f.write(cert.public_bytes(serialization.Encoding.PEM))
+        with open(key_path, "wb") as f:
+            f.write(key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption()
+            ))
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_path, key_path)
+    return context
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    # Buffer multi-line replies and flush once, so Nagle/delayed ACK
+    # don't add ~40 ms per exchange
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def reply(self, line):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+        self.wfile.flush()
+
+    def handle(self):
+        self.reply("220 localhost ESMTP sink")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("ascii", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+
+            if verb in ("EHLO", "HELO"):
+                self.wfile.write(b"250-localhost\r\n")
+                if not isinstance(self.connection, ssl.SSLSocket):
+                    self.wfile.write(b"250-STARTTLS\r\n")
+                self.reply("250 AUTH PLAIN LOGIN")
+            elif verb == "STARTTLS":
+                self.reply("220 Ready to start TLS")
+                self.connection = self.server.tls.wrap_socket(self.connection, server_side=True)
+                self.rfile = self.connection.makefile("rb")
+                self.wfile = self.connection.makefile("wb")
+            elif verb == "AUTH":
+                parts = command.split()
+                if parts[1].upper() == "LOGIN":
+                    for prompt in ("334 VXNlcm5hbWU6", "334 UGFzc3dvcmQ6"):
+                        self.reply(prompt)
+                        self.rfile.readline()
+                elif len(parts) < 3:
+                    self.reply("334 ")
+                    self.rfile.readline()
+                self.reply("235 Authentication successful")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b".\r\n", b".\n"):
+                        break
+                    size += len(data)
+                with self.server.lock:
+                    self.server.messages += 1
+                    self.server.bytes += size
+                self.reply("250 OK queued")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                # MAIL, RCPT, RSET, NOOP and anything else
+                self.reply("250 OK")
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        super().__init__((host, port), _SMTPHandler)
+        self.latency = latency
+        self.tls = self_signed_context()
+        self.lock = threading.Lock()
+        self.messages = 0
+        self.bytes = 0
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
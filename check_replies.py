@@ -1,109 +1,350 @@
 # check_replies.py
 import os
+import sys
+import time
+import random
+import ssl
+import select
+import threading
 import imaplib
 import email
-import base64
 from email.header import decode_header
 from datetime import datetime, timedelta
 import re
-from supabase import create_client
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from db import supabase, execute, fetch_in, bulk_insert, delete_in, update_in, rpc, is_missing_function
+from credentials import account_password
 
-# Initialize Supabase
-SUPABASE_URL = os.environ['SUPABASE_URL']
-SUPABASE_KEY = os.environ['SUPABASE_SERVICE_ROLE_KEY']
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+# IDLE mode settings. RFC 2177 says servers may drop an IDLE after 29 minutes,
+# so we re-issue it a little before that.
+IDLE_KEEPALIVE_SECONDS = int(os.environ.get('IMAP_IDLE_KEEPALIVE', 25 * 60))
+IDLE_BACKOFF_BASE = 5
+IDLE_BACKOFF_MAX = 300
+IDLE_ACCOUNT_REFRESH_SECONDS = 600
+# How often an IDLE wait checks whether its watcher was told to stop
+IDLE_STOP_CHECK_SECONDS = 5
+# Servers without IDLE are scanned on this interval instead
+IMAP_POLL_SECONDS = int(os.environ.get('IMAP_POLL_SECONDS', 300))
+# A watcher is restarted when any of these change on its account row
+IMAP_CONNECTION_FIELDS = ("imap_host", "imap_port", "smtp_username", "encrypted_smtp_password")
 
-# Encryption functions
-ENCRYPTION_KEY = bytes.fromhex(os.environ['ENCRYPTION_KEY'])
+def get_imap_accounts():
+    """Get all SMTP accounts with IMAP configured"""
+    accounts = execute(supabase.table("smtp_accounts").select("*").not_.is_("imap_host", "null"))
+    return accounts.data
 
-def aesgcm_decrypt(b64text: str) -> str:
-    data = base64.b64decode(b64text)
-    nonce = data[:12]
-    ct = data[12:]
-    aesgcm = AESGCM(ENCRYPTION_KEY)
-    pt = aesgcm.decrypt(nonce, ct, None)
-    return pt.decode('utf-8')
+def connect_imap(account):
+    """Open an IMAP connection for an account with the inbox selected"""
+    mail = imaplib.IMAP4_SSL(account['imap_host'], account['imap_port'])
+    mail.login(account['smtp_username'], account_password(account))
+    mail.select('inbox')
+    return mail
+
+MESSAGE_ID_RE = re.compile(r'<[^<>\s]+>')
+
+def parse_reply(msg):
+    """
+    Return the Message-IDs a message replies to plus, for legacy "Re:"
+    replies, the sender address. Returns None for anything else.
+    """
+    # In-Reply-To/References point straight at the Message-ID we stamped
+    references = " ".join(
+        str(msg.get(header) or "") for header in ("In-Reply-To", "References")
+    )
+    message_ids = MESSAGE_ID_RE.findall(references)
+
+    # Check if this is a reply to one of our sent emails
+    subject = decode_header(msg["Subject"] or "")[0][0]
+    if isinstance(subject, bytes):
+        subject = subject.decode(errors="replace")
+
+    # Check if this email is a reply (starts with "Re:")
+    from_email = None
+    if subject.lower().startswith("re:"):
+        from_email = msg.get("From") or ""
+
+        # Extract email address from the From field
+        email_match = re.search(r'<(.+?)>', from_email)
+        if email_match:
+            from_email = email_match.group(1)
+        else:
+            # If no angle brackets, try to extract email directly
+            email_match = re.search(r'[\w\.-]+@[\w\.-]+', from_email)
+            if email_match:
+                from_email = email_match.group(0)
+        from_email = from_email.strip().lower() or None
+
+    if not message_ids and not from_email:
+        return None
+    return {"message_ids": message_ids, "sender": from_email}
+
+def scan_inbox(mail):
+    """Collect replies from unseen emails of the last 24 hours"""
+    since_date = (datetime.now() - timedelta(days=1)).strftime("%d-%b-%Y")
+    status, messages = mail.search(None, f'(UNSEEN SINCE {since_date})')
+    email_ids = messages[0].split()
+
+    replies = []
+    for email_id in email_ids:
+        # Fetch the email
+        status, msg_data = mail.fetch(email_id, '(RFC822)')
+
+        for response in msg_data:
+            if isinstance(response, tuple):
+                reply = parse_reply(email.message_from_bytes(response[1]))
+                if reply:
+                    replies.append(reply)
+    return replies
+
+def mark_leads_responded(lead_ids):
+    """Apply all reply-side state changes for a batch of leads"""
+    lead_ids = list(lead_ids)
+    try:
+        # One transactional round-trip (see sql/001_mark_leads_responded.sql)
+        rpc("mark_leads_responded", {"p_lead_ids": lead_ids})
+        return
+    except Exception as e:
+        # Any other failure may have committed; a second pass would copy the
+        # leads into responded_leads twice
+        if not is_missing_function(e):
+            raise
+        print(f"mark_leads_responded RPC unavailable, using bulk writes: {str(e)}")
+
+    leads = fetch_in("leads", "id", lead_ids)
+
+    # Copy the leads to responded_leads table
+    bulk_insert("responded_leads", [{
+        "original_lead_id": lead['id'],
+        "email": lead['email'],
+        "name": lead['name'],
+        "last_name": lead.get('last_name'),
+        "city": lead.get('city'),
+        "brokerage": lead.get('brokerage'),
+        "service": lead.get('service'),
+        "list_name": lead.get('list_name'),
+        "custom_fields": lead.get('custom_fields')
+    } for lead in leads])
+
+    # Delete any still-queued emails for these leads. Sent rows stay so their
+    # message_id keeps matching later replies in the thread.
+    execute(
+        supabase.table("email_queue").delete()
+        .in_("lead_id", lead_ids)
+        .is_("sent_at", "null")
+    )
+
+    # Remove any account assignments for these leads
+    delete_in("lead_campaign_accounts", "lead_id", lead_ids)
+
+    # Mark the leads as responded in the leads table (don't delete them)
+    update_in("leads", {
+        "responded": True,
+        "responded_at": datetime.now().isoformat()
+    }, "id", lead_ids)
+
+def process_replies(replies):
+    """Resolve replies to leads and mark them responded in bulk"""
+    if not replies:
+        return 0
+
+    # Exact match: referenced Message-IDs against the email_queue index
+    message_ids = {mid for reply in replies for mid in reply["message_ids"]}
+    sent = fetch_in("email_queue", "message_id", message_ids, columns="lead_id, message_id")
+    lead_by_message_id = {row["message_id"]: row["lead_id"] for row in sent}
+
+    lead_ids = set()
+    senders = set()
+    for reply in replies:
+        matched = [lead_by_message_id[mid] for mid in reply["message_ids"] if mid in lead_by_message_id]
+        if matched:
+            lead_ids.update(matched)
+        elif reply["sender"]:
+            # Mail sent before Message-IDs were stamped: match on the sender
+            senders.add(reply["sender"])
+
+    if senders:
+        lead_ids.update(lead["id"] for lead in fetch_in("leads", "email", senders, columns="id"))
+
+    if not lead_ids:
+        return 0
+
+    mark_leads_responded(sorted(lead_ids))
+    print(f"Marked {len(lead_ids)} leads as responded: {sorted(lead_ids)}")
+    return len(lead_ids)
 
 def check_for_replies():
-    # Get all SMTP accounts with IMAP configured
-    accounts = supabase.table("smtp_accounts").select("*").not_.is_("imap_host", "null").execute()
-    
-    for account in accounts.data:
+    replies = []
+    for account in get_imap_accounts():
         try:
-            # Connect to IMAP server
-            mail = imaplib.IMAP4_SSL(account['imap_host'], account['imap_port'])
-            mail.login(account['smtp_username'], aesgcm_decrypt(account['encrypted_smtp_password']))
-            mail.select('inbox')
-            
-            # Search for unseen emails from the last 24 hours
-            since_date = (datetime.now() - timedelta(days=1)).strftime("%d-%b-%Y")
-            status, messages = mail.search(None, f'(UNSEEN SINCE {since_date})')
-            email_ids = messages[0].split()
-            
-            for email_id in email_ids:
-                # Fetch the email
-                status, msg_data = mail.fetch(email_id, '(RFC822)')
-                
-                for response in msg_data:
-                    if isinstance(response, tuple):
-                        msg = email.message_from_bytes(response[1])
-                        
-                        # Check if this is a reply to one of our sent emails
-                        subject = decode_header(msg["Subject"])[0][0]
-                        if isinstance(subject, bytes):
-                            subject = subject.decode()
-                        
-                        # Check if this email is a reply (starts with "Re:")
-                        if subject.lower().startswith("re:"):
-                            from_email = msg.get("From")
-                            
-                            # Extract email address from the From field
-                            email_match = re.search(r'<(.+?)>', from_email)
-                            if email_match:
-                                from_email = email_match.group(1)
-                            else:
-                                # If no angle brackets, try to extract email directly
-                                email_match = re.search(r'[\w\.-]+@[\w\.-]+', from_email)
-                                if email_match:
-                                    from_email = email_match.group(0)
-                            
-                            # Find the lead by email
-                            lead = supabase.table("leads").select("*").eq("email", from_email).execute()
-                            
-                            if lead.data:
-                                # Copy the lead to responded_leads table
-                                supabase.table("responded_leads").insert({
-                                    "original_lead_id": lead.data[0]['id'],
-                                    "email": lead.data[0]['email'],
-                                    "name": lead.data[0]['name'],
-                                    "last_name": lead.data[0].get('last_name'),
-                                    "city": lead.data[0].get('city'),
-                                    "brokerage": lead.data[0].get('brokerage'),
-                                    "service": lead.data[0].get('service'),
-                                    "list_name": lead.data[0].get('list_name'),
-                                    "custom_fields": lead.data[0].get('custom_fields')
-                                }).execute()
-                                
-                                # Delete any queued emails for this lead
-                                supabase.table("email_queue").delete().eq("lead_id", lead.data[0]['id']).execute()
-                                
-                                # Remove any account assignments for this lead
-                                supabase.table("lead_campaign_accounts").delete().eq("lead_id", lead.data[0]['id']).execute()
-                                
-                                # Mark the lead as responded in the leads table (don't delete it)
-                                supabase.table("leads").update({
-                                    "responded": True,
-                                    "responded_at": datetime.now().isoformat()
-                                }).eq("id", lead.data[0]['id']).execute()
-                                
-                                print(f"Marked lead {from_email} as responded")
-            
+            mail = connect_imap(account)
+            replies.extend(scan_inbox(mail))
             mail.close()
             mail.logout()
-            
+
         except Exception as e:
             print(f"Error checking replies for {account['email']}: {str(e)}")
 
+    process_replies(replies)
+
+# ---------- IDLE mode ----------
+def _buffered(mail):
+    """
+    True if imaplib's reader already holds unread bytes, e.g. an EXISTS that
+    arrived in the same packet as the IDLE continuation. select() can't see
+    those (nor TLS records decrypted but not yet read), so peek without
+    blocking.
+    """
+    sock = mail.socket()
+    timeout = sock.gettimeout()
+    sock.setblocking(False)
+    try:
+        return bool(mail.file.peek(1))
+    except (BlockingIOError, ssl.SSLWantReadError):
+        return False
+    finally:
+        sock.settimeout(timeout)
+
+def _readable(mail, timeout):
+    """Wait until the IMAP connection has data to read or the timeout passes"""
+    if _buffered(mail):
+        return True
+    ready, _, _ = select.select([mail.socket()], [], [], max(timeout, 0))
+    return bool(ready)
+
+def idle_wait(mail, timeout, stop_event=None):
+    """
+    Issue IDLE and block until the server reports new mail, the timeout
+    passes or stop_event is set. Returns True if new messages may have
+    arrived.
+    """
+    tag = mail._new_tag()
+    mail.send(tag + b" IDLE\r\n")
+    line = mail.readline()
+    if not line.startswith(b"+"):
+        raise imaplib.IMAP4.abort(f"IDLE rejected: {line!r}")
+
+    has_new = False
+    deadline = time.monotonic() + timeout
+    while not has_new:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or (stop_event is not None and stop_event.is_set()):
+            break
+        if not _readable(mail, min(remaining, IDLE_STOP_CHECK_SECONDS)):
+            continue
+        line = mail.readline()
+        if not line:
+            raise imaplib.IMAP4.abort("connection closed during IDLE")
+        if line.startswith(b"* BYE"):
+            raise imaplib.IMAP4.abort(line.decode(errors="replace").strip())
+        if line.rstrip().endswith((b"EXISTS", b"RECENT")):
+            has_new = True
+
+    mail.send(b"DONE\r\n")
+    # Drain untagged responses until the IDLE command completes
+    while True:
+        line = mail.readline()
+        if not line:
+            raise imaplib.IMAP4.abort("connection closed while ending IDLE")
+        if line.startswith(tag):
+            if b" OK" not in line:
+                raise imaplib.IMAP4.abort(f"IDLE failed: {line!r}")
+            break
+        if line.rstrip().endswith((b"EXISTS", b"RECENT")):
+            has_new = True
+    return has_new
+
+def idle_account(account, stop_event):
+    """
+    Hold an IDLE connection for one account, reconnecting with backoff.
+    Servers without IDLE are polled every IMAP_POLL_SECONDS instead.
+    """
+    failures = 0
+    while not stop_event.is_set():
+        mail = None
+        try:
+            mail = connect_imap(account)
+            idle = "IDLE" in mail.capabilities
+            if failures == 0 and not idle:
+                print(f"IMAP server for {account['email']} does not support IDLE; polling every {IMAP_POLL_SECONDS}s")
+            failures = 0
+            if idle:
+                print(f"IDLE connected for {account['email']}")
+
+            # Catch anything that arrived while we were disconnected
+            process_replies(scan_inbox(mail))
+            while not stop_event.is_set():
+                if idle:
+                    if idle_wait(mail, IDLE_KEEPALIVE_SECONDS, stop_event):
+                        process_replies(scan_inbox(mail))
+                elif not stop_event.wait(IMAP_POLL_SECONDS):
+                    process_replies(scan_inbox(mail))
+        except Exception as e:
+            failures += 1
+            delay = min(IDLE_BACKOFF_BASE * 2 ** (failures - 1), IDLE_BACKOFF_MAX)
+            delay = delay * random.uniform(0.5, 1.0)
+            print(f"IDLE error for {account['email']}: {str(e)}; reconnecting in {delay:.0f}s")
+            stop_event.wait(delay)
+        finally:
+            if mail is not None:
+                try:
+                    mail.logout()
+                except Exception:
+                    pass
+
+def _connection_settings(account):
+    return tuple(account.get(field) for field in IMAP_CONNECTION_FIELDS)
+
+def run_idle():
+    """
+    Watch every IMAP account with IDLE until interrupted. The account list
+    is reloaded every IDLE_ACCOUNT_REFRESH_SECONDS: watchers of deleted
+    accounts are stopped, and a watcher whose connection settings changed
+    is replaced by one using the new row.
+    """
+    watchers = {}
+    try:
+        while True:
+            try:
+                accounts = {account['email']: account for account in get_imap_accounts()}
+            except Exception as e:
+                print(f"Error loading IMAP accounts: {str(e)}")
+                accounts = None
+
+            if accounts is not None:
+                for email_address in list(watchers):
+                    if email_address not in accounts:
+                        print(f"Stopping IDLE watcher for removed account {email_address}")
+                        watchers.pop(email_address)["stop"].set()
+
+                for email_address, account in accounts.items():
+                    watcher = watchers.get(email_address)
+                    if watcher and watcher["thread"].is_alive():
+                        if watcher["settings"] == _connection_settings(account):
+                            continue
+                        print(f"Account {email_address} changed; restarting its IDLE watcher")
+                        watcher["stop"].set()
+
+                    stop_event = threading.Event()
+                    thread = threading.Thread(
+                        target=idle_account,
+                        args=(account, stop_event),
+                        name=f"idle-{email_address}",
+                        daemon=True
+                    )
+                    thread.start()
+                    watchers[email_address] = {
+                        "thread": thread,
+                        "stop": stop_event,
+                        "settings": _connection_settings(account),
+                    }
+
+            time.sleep(IDLE_ACCOUNT_REFRESH_SECONDS)
+    except KeyboardInterrupt:
+        print("Stopping IDLE watchers")
+        for watcher in watchers.values():
+            watcher["stop"].set()
+
 if __name__ == "__main__":
-    check_for_replies()
+    if "--idle" in sys.argv[1:]:
+        run_idle()
+    else:
+        check_for_replies()
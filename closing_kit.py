@@ -0,0 +1,196 @@
+# closing_kit.py
+import os
+import queue
+import zipfile
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from docxtpl import DocxTemplate
+
+# Documents of the transaction autopilot closing kit, rendered by
+# public.generate_full_kit. Templates are read once and re-read when their
+# mtime changes; the documents of a kit render in parallel.
+KIT_TEMPLATE_DIR = "templates/transaction_autopilot"
+
+KIT_DOCUMENTS = [
+    # (label for errors, file name in the kit, template)
+    ("LOI", "Letter_of_Intent.docx", "loi_template.docx"),
+    ("PSA", "Purchase_Sale_Agreement.docx", "psa_template.docx"),
+    ("Purchase Offer", "Purchase_Offer.docx", "purchase_offer_template.docx"),
+    ("Agency Disclosure", "Agency_Disclosure.docx", "agency_disclosure_template.docx"),
+    ("Real Estate Purchase Agreement", "Real_Estate_Purchase_Agreement.docx", "real_estate_purchase_template.docx"),
+    ("Lease Agreement", "Lease_Agreement.docx", "lease_template.docx"),
+    ("Seller Disclosure", "Seller_Disclosure.docx", "seller_disclosure_template.docx"),
+]
+
+KIT_DEFAULTS = {
+    "transaction_type": "Purchase",
+    "rent_type": "Annual Lease",
+    "inspection_days": 10,
+    "mortgage_years": 30,
+    "interest_rate": 3.5,
+    "parking_spaces": 1,
+    "broker_name": "John Smith",
+}
+
+_pool = ThreadPoolExecutor(max_workers=len(KIT_DOCUMENTS), thread_name_prefix="closing-kit")
+
+class TemplateCache:
+    """
+    Parsed DocxTemplates by path. render() rewrites a template's document
+    in place, so a parsed copy can only be used once: checkout() hands out
+    a spare that was parsed ahead of time and parses its replacement in the
+    background, keeping parsing off the request path. The file is read
+    again only when its mtime changes.
+    """
+
+    def __init__(self, spares=2):
+        self.spares = spares
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _parse(self, data):
+        tpl = DocxTemplate(BytesIO(data))
+        tpl.init_docx()
+        return tpl
+
+    def _entry(self, path):
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry["mtime"] == mtime:
+                return entry
+        with open(path, "rb") as f:
+            data = f.read()
+        entry = {"mtime": mtime, "data": data, "spares": [], "refilling": False}
+        with self._lock:
+            self._entries[path] = entry
+        return entry
+
+    def _refill(self, path, entry):
+        try:
+            while True:
+                with self._lock:
+                    if len(entry["spares"]) >= self.spares or self._entries.get(path) is not entry:
+                        return
+                tpl = self._parse(entry["data"])
+                with self._lock:
+                    entry["spares"].append(tpl)
+        except Exception as e:
+            print(f"Error parsing template {path}: {e}")
+        finally:
+            with self._lock:
+                entry["refilling"] = False
+
+    def checkout(self, path):
+        """A parsed, not yet rendered DocxTemplate for path"""
+        entry = self._entry(path)
+        with self._lock:
+            tpl = entry["spares"].pop() if entry["spares"] else None
+            refill = not entry["refilling"]
+            entry["refilling"] = True
+        if refill:
+            threading.Thread(target=self._refill, args=(path, entry), daemon=True).start()
+        return tpl or self._parse(entry["data"])
+
+    def version(self, path):
+        """mtime of the template as last loaded"""
+        return self._entry(path)["mtime"]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+TEMPLATES = TemplateCache()
+
+def kit_context(data):
+    """Form data, stripped, with defaults for missing or empty fields"""
+    context = {key: value.strip() if isinstance(value, str) else value for key, value in data.items()}
+    for key, value in KIT_DEFAULTS.items():
+        if key not in context or not context[key]:
+            context[key] = value
+    return context
+
+def template_versions():
+    """{template: mtime} for the kit, None for a template that's missing"""
+    versions = {}
+    for _, _, template in KIT_DOCUMENTS:
+        try:
+            versions[template] = TEMPLATES.version(os.path.join(KIT_TEMPLATE_DIR, template))
+        except OSError:
+            versions[template] = None
+    return versions
+
+def render_document(template, context):
+    tpl = TEMPLATES.checkout(os.path.join(KIT_TEMPLATE_DIR, template))
+    tpl.render(context)
+    bio = BytesIO()
+    tpl.save(bio)
+    bio.seek(0)
+    return bio
+
+def iter_kit(context):
+    """
+    Yield (file name, BytesIO) for each kit document as soon as it has
+    rendered; the documents render concurrently. One that fails is logged
+    and left out. Nothing keeps a document once the caller moves on.
+    """
+    done = queue.Queue()
+
+    def render(label, filename, template):
+        try:
+            done.put((label, filename, render_document(template, context), None))
+        except Exception as e:
+            done.put((label, filename, None, e))
+
+    for label, filename, template in KIT_DOCUMENTS:
+        _pool.submit(render, label, filename, template)
+
+    for _ in KIT_DOCUMENTS:
+        label, filename, bio, error = done.get()
+        if error is not None:
+            print(f"Error generating {label}: {error}")
+            continue
+        yield filename, bio
+
+# ---------- Streaming ZIP ----------
+KIT_CHUNK_SIZE = 64 * 1024
+
+class _ZipSink:
+    """Write-only target for ZipFile that hands back what was written"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def stream_kit(context, written=None):
+    """
+    The kit as a ZIP, yielded in chunks while it is built. Each document
+    goes out as soon as it has rendered; the sink has no tell() so ZipFile
+    writes sizes in data descriptors instead of seeking back. Names of the
+    documents included are appended to written, if given.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w") as zip_file:
+        for filename, bio in iter_kit(context):
+            if written is not None:
+                written.append(filename)
+            view = bio.getbuffer()
+            with zip_file.open(filename, "w") as entry:
+                for start in range(0, len(view), KIT_CHUNK_SIZE):
+                    entry.write(view[start:start + KIT_CHUNK_SIZE])
+                    yield sink.drain()
+            view.release()
+            yield sink.drain()
+    yield sink.drain()
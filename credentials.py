@@ -0,0 +1,103 @@
+# credentials.py
+import os
+import sys
+import time
+import base64
+import secrets
+import threading
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+# Encryption keys (32 bytes hex). ENCRYPTION_KEY is key version 1 and also
+# decrypts legacy ciphertexts without a version prefix. Extra versions for
+# rotation come from ENCRYPTION_KEYS="2:<hex>,3:<hex>"; new secrets are
+# encrypted with ENCRYPTION_KEY_VERSION (default: the highest version).
+def _load_keys():
+    keys = {1: bytes.fromhex(os.environ['ENCRYPTION_KEY'])}
+    for entry in os.environ.get('ENCRYPTION_KEYS', '').split(','):
+        if entry.strip():
+            version, key_hex = entry.split(':', 1)
+            keys[int(version)] = bytes.fromhex(key_hex.strip())
+    return keys
+
+_CIPHERS = {version: AESGCM(key) for version, key in _load_keys().items()}
+CURRENT_KEY_VERSION = int(os.environ.get('ENCRYPTION_KEY_VERSION', max(_CIPHERS)))
+if CURRENT_KEY_VERSION not in _CIPHERS:
+    raise RuntimeError(f"ENCRYPTION_KEY_VERSION {CURRENT_KEY_VERSION} has no key")
+
+# Decrypted secrets are kept in memory for this long (seconds)
+CREDENTIAL_CACHE_TTL = int(os.environ.get('CREDENTIAL_CACHE_TTL', 900))
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+def _split_version(token: str):
+    """Return (key version, base64 payload) for a stored ciphertext"""
+    if token.startswith('v') and ':' in token:
+        version, payload = token[1:].split(':', 1)
+        if version.isdigit():
+            return int(version), payload
+    return 1, token
+
+def aesgcm_encrypt(plaintext: str) -> str:
+    nonce = secrets.token_bytes(12)
+    ct = _CIPHERS[CURRENT_KEY_VERSION].encrypt(nonce, plaintext.encode('utf-8'), None)
+    return f"v{CURRENT_KEY_VERSION}:" + base64.b64encode(nonce + ct).decode('utf-8')
+
+def aesgcm_decrypt(token: str) -> str:
+    version, payload = _split_version(token)
+    data = base64.b64decode(payload)
+    nonce = data[:12]
+    ct = data[12:]
+    pt = _CIPHERS[version].decrypt(nonce, ct, None)
+    return pt.decode('utf-8')
+
+def get_secret(token: str) -> str:
+    """Decrypt a stored secret, reusing the plaintext for CREDENTIAL_CACHE_TTL"""
+    now = time.monotonic()
+    with _cache_lock:
+        hit = _cache.get(token)
+        if hit and hit[1] > now:
+            return hit[0]
+
+    plaintext = aesgcm_decrypt(token)
+    with _cache_lock:
+        # Drop expired entries so the cache stays bounded by live accounts
+        for key in [k for k, (_, expires) in _cache.items() if expires <= now]:
+            del _cache[key]
+        _cache[token] = (plaintext, now + CREDENTIAL_CACHE_TTL)
+    return plaintext
+
+def account_password(account) -> str:
+    """Decrypted SMTP/IMAP password for an smtp_accounts row"""
+    return get_secret(account["encrypted_smtp_password"])
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+def needs_rotation(token: str) -> bool:
+    return _split_version(token)[0] != CURRENT_KEY_VERSION
+
+def rotate(token: str) -> str:
+    """Re-encrypt a stored secret with the current key version"""
+    return aesgcm_encrypt(aesgcm_decrypt(token))
+
+def rotate_account_passwords(supabase):
+    """Re-encrypt every smtp_accounts password still on an old key version"""
+    accounts = supabase.table("smtp_accounts").select("id, encrypted_smtp_password").execute()
+    rotated = 0
+    for account in accounts.data:
+        if needs_rotation(account["encrypted_smtp_password"]):
+            supabase.table("smtp_accounts") \
+                .update({"encrypted_smtp_password": rotate(account["encrypted_smtp_password"])}) \
+                .eq("id", account["id"]) \
+                .execute()
+            rotated += 1
+    return rotated
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["rotate"]:
+        from db import get_client
+        print(f"Rotated {rotate_account_passwords(get_client())} account password(s) to key v{CURRENT_KEY_VERSION}")
+    else:
+        print("usage: python credentials.py rotate")
@@ -0,0 +1,228 @@
+# db.py
+import os
+import time
+import random
+import threading
+import contextvars
+
+# One Supabase client per process, created on first use so importing a
+# module that talks to the database doesn't pay for the client up front.
+# All table/rpc calls go through its single httpx session, so connections
+# are kept alive and reused.
+DB_TIMEOUT = float(os.environ.get('DB_TIMEOUT', 10))
+DB_RETRIES = int(os.environ.get('DB_RETRIES', 3))
+DB_RETRY_BASE = 0.25
+DB_RETRY_MAX = 4.0
+CHUNK_SIZE = 100
+
+_client = None
+_client_lock = threading.Lock()
+
+class TransientDBError(Exception):
+    """PostgREST answered 429 or 5xx; the request may succeed if retried"""
+
+    def __init__(self, status_code, body=""):
+        super().__init__(f"HTTP {status_code}: {body[:200]}")
+        self.status_code = status_code
+
+# Per-request call accounting: tracing.py puts a CallStats in this context
+# variable, and the httpx hooks below add every PostgREST round-trip to it.
+class CallStats:
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        # Requests that fan out (lead_summary) update this from several threads
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.calls += 1
+            self.seconds += seconds
+
+current_call_stats = contextvars.ContextVar("current_call_stats", default=None)
+
+def _mark_request_start(request):
+    request.extensions["db_start"] = time.perf_counter()
+
+def _record_call(response):
+    stats = current_call_stats.get()
+    start = response.request.extensions.get("db_start")
+    if stats is not None and start is not None:
+        stats.add(time.perf_counter() - start)
+
+def _raise_transient(response):
+    if response.status_code == 429 or response.status_code >= 500:
+        response.read()
+        raise TransientDBError(response.status_code, response.text)
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from supabase import create_client
+                from supabase.lib.client_options import ClientOptions
+                client = create_client(
+                    os.environ['SUPABASE_URL'],
+                    os.environ['SUPABASE_SERVICE_ROLE_KEY'],
+                    options=ClientOptions(postgrest_client_timeout=DB_TIMEOUT)
+                )
+                # Count round-trips, and surface 429/5xx as TransientDBError
+                # before postgrest parses the body
+                session = client.postgrest.session
+                hooks = session.event_hooks
+                session.event_hooks = {
+                    "request": hooks.get("request", []) + [_mark_request_start],
+                    "response": hooks.get("response", []) + [_record_call, _raise_transient],
+                }
+                _client = client
+    return _client
+
+class _LazyClient:
+    """Stand-in for the Supabase client that builds it on first attribute access"""
+
+    def __getattr__(self, name):
+        return getattr(get_client(), name)
+
+supabase = _LazyClient()
+
+# ---------- Retries ----------
+def _is_transient(error, idempotent):
+    import httpx
+    if isinstance(error, TransientDBError):
+        # A 429 was rejected before doing any work; 5xx may have half-applied
+        return idempotent or error.status_code == 429
+    if isinstance(error, httpx.ConnectError):
+        return True
+    return idempotent and isinstance(error, (httpx.TimeoutException, httpx.TransportError))
+
+def execute(query, idempotent=True, retries=None):
+    """
+    Run a query builder's execute() with jittered exponential backoff on
+    429/5xx and transport errors. Non-idempotent writes are only retried
+    when the request can't have been applied (429, connect failure).
+    """
+    retries = DB_RETRIES if retries is None else retries
+    for attempt in range(retries + 1):
+        try:
+            return query.execute()
+        except Exception as e:
+            if attempt == retries or not _is_transient(e, idempotent):
+                raise
+            delay = min(DB_RETRY_BASE * 2 ** attempt, DB_RETRY_MAX)
+            time.sleep(random.uniform(0, delay))
+
+def rpc(name, params, idempotent=False):
+    return execute(supabase.rpc(name, params), idempotent=idempotent)
+
+def not_applied(error):
+    """The write can't have happened: rejected with 429, or never connected"""
+    return _is_transient(error, idempotent=False)
+
+# PostgREST's "function not found in the schema cache", and Postgres'
+# undefined_function
+MISSING_FUNCTION_CODES = ("PGRST202", "42883")
+
+def is_missing_function(error):
+    """
+    The RPC doesn't exist (its migration isn't applied), so nothing ran.
+    Callers with a Python fallback should use it only in this case: after a
+    timeout or 5xx the function may already have committed.
+    """
+    return getattr(error, "code", None) in MISSING_FUNCTION_CODES
+
+# ---------- Request coalescing ----------
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+def coalesce(key, fn):
+    """
+    Single-flight: concurrent callers with the same key share one call to
+    fn. Nothing is cached once the call finishes.
+    """
+    with _inflight_lock:
+        call = _inflight.get(key)
+        leader = call is None
+        if leader:
+            call = _inflight[key] = _Call()
+
+    if not leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        call.result = fn()
+        return call.result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+        call.done.set()
+
+# ---------- Typed reads ----------
+def fetch(table, columns="*", eq=None, order=None, desc=False, limit=None):
+    """
+    Select rows matching equality filters. Identical concurrent reads are
+    coalesced into one request. Returns the list of rows.
+    """
+    eq = eq or {}
+    key = ("fetch", table, columns, tuple(sorted(eq.items())), order, desc, limit)
+
+    def run():
+        query = supabase.table(table).select(columns)
+        for column, value in eq.items():
+            query = query.eq(column, value)
+        if order:
+            query = query.order(order, desc=desc)
+        if limit:
+            query = query.limit(limit)
+        return execute(query).data
+
+    return coalesce(key, run)
+
+def fetch_in(table, column, values, columns="*", chunk_size=CHUNK_SIZE):
+    """Select rows whose column is in values, chunked to keep URLs short"""
+    values = list(dict.fromkeys(values))
+    rows = []
+    for i in range(0, len(values), chunk_size):
+        chunk = values[i:i + chunk_size]
+        rows.extend(execute(supabase.table(table).select(columns).in_(column, chunk)).data)
+    return rows
+
+# ---------- Typed batch writes ----------
+def bulk_insert(table, rows, chunk_size=CHUNK_SIZE):
+    """Insert rows in chunks. Returns the inserted rows."""
+    inserted = []
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i:i + chunk_size]
+        inserted.extend(execute(supabase.table(table).insert(chunk), idempotent=False).data)
+    return inserted
+
+def bulk_upsert(table, rows, on_conflict=None, chunk_size=CHUNK_SIZE):
+    """Upsert rows in chunks. Upserts are idempotent, so they are retried."""
+    upserted = []
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i:i + chunk_size]
+        upserted.extend(execute(supabase.table(table).upsert(chunk, on_conflict=on_conflict or "")).data)
+    return upserted
+
+def update_in(table, values, column, ids, chunk_size=CHUNK_SIZE):
+    """Apply the same update to every row whose column is in ids"""
+    ids = list(ids)
+    for i in range(0, len(ids), chunk_size):
+        execute(supabase.table(table).update(values).in_(column, ids[i:i + chunk_size]))
+
+def delete_in(table, column, ids, chunk_size=CHUNK_SIZE):
+    ids = list(ids)
+    for i in range(0, len(ids), chunk_size):
+        execute(supabase.table(table).delete().in_(column, ids[i:i + chunk_size]))
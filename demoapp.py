@@ -3,12 +3,76 @@ from flask_cors import CORS
 import requests
 import os
 import time
+import threading
+from db import coalesce
+from reply_cache import normalize_prompt
 
 app = Flask(__name__)
 CORS(app)
 
 # Configuration
 EXTERNAL_AI_API = "https://website-1-f6l8.onrender.com/api/generate-reply-prompt"
+# After this many upstream failures in a row, serve the fallback straight
+# away for DEMO_BREAKER_COOLDOWN seconds before trying upstream again
+DEMO_BREAKER_THRESHOLD = int(os.environ.get('DEMO_BREAKER_THRESHOLD', 3))
+DEMO_BREAKER_COOLDOWN = float(os.environ.get('DEMO_BREAKER_COOLDOWN', 30))
+
+# Keep-alive connections to the upstream API, shared by all requests
+session = requests.Session()
+session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=32))
+
+class CircuitBreaker:
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """False while open; after the cooldown one trial call goes through"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                # Half-open: re-arm so only this caller probes upstream
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    print(f"Upstream AI failed {self.failures} times; serving fallback for {self.cooldown:.0f}s")
+                self.opened_at = time.monotonic()
+
+breaker = CircuitBreaker(DEMO_BREAKER_THRESHOLD, DEMO_BREAKER_COOLDOWN)
+
+def call_upstream(prompt):
+    """(status code, JSON body or None) from the external AI API"""
+    try:
+        response = session.post(
+            EXTERNAL_AI_API,
+            json={"prompt": prompt},
+            timeout=(5, 30)
+        )
+    except requests.exceptions.RequestException:
+        breaker.failure()
+        raise
+
+    if response.status_code == 200:
+        breaker.success()
+        return 200, response.json()
+    if response.status_code >= 500 or response.status_code == 429:
+        breaker.failure()
+    return response.status_code, None
 
 @app.route('/api/generate-reply-prompt', methods=['POST', 'OPTIONS'])
 def generate_reply_prompt():
@@ -22,15 +86,18 @@ def generate_reply_prompt():
         if not prompt:
             return jsonify({"error": "Missing prompt"}), 400
         
-        # Call the external AI API
-        response = requests.post(
-            EXTERNAL_AI_API,
-            json={"prompt": prompt},
-            timeout=30
-        )
+        if not breaker.allow():
+            return jsonify({
+                "error": "AI service unavailable",
+                "fallback_response": generate_fallback_response(prompt)
+            }), 503
+
+        # Call the external AI API; visitors submitting the same prompt at
+        # the same time share one upstream call
+        status_code, body = coalesce(("demo-reply", normalize_prompt(prompt)), lambda: call_upstream(prompt))
         
-        if response.status_code == 200:
-            return jsonify(response.json())
+        if status_code == 200:
+            return jsonify(body)
         else:
             return jsonify({
                 "error": "AI service unavailable",
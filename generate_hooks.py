@@ -0,0 +1,235 @@
+# generate_hooks.py
+"""
+Generate ai_hooks for every lead in a list that doesn't have one.
+
+    python generate_hooks.py "Austin agents" [--concurrency 8] [--rpm 30] [--backend groq|github]
+
+Hooks are appended to a checkpoint file as they come back and written to
+leads in batches, so an interrupted run picks up where it stopped without
+paying for the same hooks twice.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from db import supabase, execute, rpc
+
+HOOK_CONCURRENCY = int(os.environ.get('HOOK_CONCURRENCY', 8))
+# Requests per minute across all workers; Groq's free tier allows 30
+HOOK_RPM = float(os.environ.get('HOOK_RPM', 30))
+HOOK_BATCH_SIZE = 100
+HOOK_MAX_ATTEMPTS = 5
+HOOK_MAX_CHARS = 300
+PAGE_SIZE = 1000
+
+HOOK_SYSTEM_PROMPT = "You write short, specific opening lines for cold emails to real estate agents."
+HOOK_PARAMS = {"temperature": 0.7, "max_tokens": 80, "top_p": 0.9}
+
+class RateLimiter:
+    """
+    Spaces requests evenly to stay under `rpm` and lets any worker pause
+    everyone when the API says it's rate limited.
+    """
+
+    def __init__(self, rpm):
+        self.interval = 60.0 / rpm if rpm > 0 else 0.0
+        self._next = 0.0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next, self._paused_until)
+            self._next = slot + self.interval
+        time.sleep(max(0.0, slot - now))
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        print(f"Rate limited; pausing requests for {seconds:.0f}s")
+
+def leads_missing_hooks(list_name):
+    """Leads in the list whose ai_hooks is null or empty"""
+    leads = []
+    offset = 0
+    while True:
+        page = execute(
+            supabase.table("leads")
+            .select("id, email, name, last_name, city, brokerage, service, street, open_house, last_sale, custom_fields, ai_hooks")
+            .eq("list_name", list_name)
+            .order("id")
+            .range(offset, offset + PAGE_SIZE - 1)
+        )
+        leads.extend(lead for lead in page.data if not (lead.get("ai_hooks") or "").strip())
+        if len(page.data) < PAGE_SIZE:
+            return leads
+        offset += PAGE_SIZE
+
+def hook_prompt(lead):
+    facts = {
+        "Name": " ".join(filter(None, [lead.get("name"), lead.get("last_name")])),
+        "City": lead.get("city"),
+        "Brokerage": lead.get("brokerage"),
+        "Service": lead.get("service"),
+        "Street": lead.get("street"),
+        "Open house": lead.get("open_house"),
+        "Last sale": lead.get("last_sale"),
+    }
+    for key, value in (lead.get("custom_fields") or {}).items():
+        facts[key] = value
+    details = "\n".join(f"{k}: {v}" for k, v in facts.items() if v)
+    return (
+        "Write one opening line (under 25 words) for a cold email to this real estate agent. "
+        "Mention something specific from their details. Return only the line, no quotes.\n\n"
+        f"{details}"
+    )
+
+def clean_hook(text):
+    line = next((l.strip() for l in text.strip().splitlines() if l.strip()), "")
+    return line.strip('"“”\'').strip()[:HOOK_MAX_CHARS]
+
+def _complete(prompt, backend):
+    if backend == "groq":
+        from ai_reply import groq_completion
+        return groq_completion(prompt, os.environ["GROQ_API_KEY"], system=HOOK_SYSTEM_PROMPT, params=HOOK_PARAMS)
+    from utils import callAIML_from_flask
+    return callAIML_from_flask(prompt)
+
+def _retryable(error):
+    """5xx replies, timeouts, dropped connections and empty hooks"""
+    import requests
+    from ai_reply import GroqError
+    if isinstance(error, GroqError):
+        return error.transient
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code >= 500
+    return isinstance(error, (requests.Timeout, requests.ConnectionError, EmptyHook))
+
+class EmptyHook(ValueError):
+    """The model returned nothing usable"""
+
+def generate_hook(lead, backend, limiter):
+    """Hook text for one lead, retrying rate limits and transient errors with backoff"""
+    from ai_reply import GroqRateLimited
+    from utils import ModelUnavailable
+
+    prompt = hook_prompt(lead)
+    for attempt in range(1, HOOK_MAX_ATTEMPTS + 1):
+        limiter.acquire()
+        try:
+            hook = clean_hook(_complete(prompt, backend))
+            if hook:
+                return hook
+            raise EmptyHook("empty hook")
+        except GroqRateLimited as e:
+            limiter.pause(e.retry_after or min(60, 5 * 2 ** attempt))
+        except ModelUnavailable:
+            # callAIML_from_flask: every model is rate-limited or missing
+            limiter.pause(min(60, 5 * 2 ** attempt))
+        except Exception as e:
+            if attempt == HOOK_MAX_ATTEMPTS or not _retryable(e):
+                raise
+            time.sleep(min(30, 2 ** attempt) * random.uniform(0.8, 1.2))
+    raise RuntimeError(f"no hook for lead {lead['id']} after {HOOK_MAX_ATTEMPTS} attempts")
+
+# ---------- Checkpoint + write-back ----------
+def checkpoint_path(list_name):
+    safe = "".join(c if c.isalnum() else "_" for c in list_name)
+    return os.path.join(os.environ.get("HOOK_CHECKPOINT_DIR", "."), f".hooks_{safe}.jsonl")
+
+def load_checkpoint(path):
+    """{lead id: hook} generated by an earlier run"""
+    hooks = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn last line from a killed run
+                hooks[entry["id"]] = entry["hook"]
+    return hooks
+
+def write_hooks(hooks):
+    """Store {lead id: hook} on leads that still have no hook"""
+    if not hooks:
+        return
+    try:
+        # One round-trip (see sql/008_set_ai_hooks.sql)
+        rpc("set_ai_hooks", {"p_hooks": {str(k): v for k, v in hooks.items()}}, idempotent=True)
+        return
+    except Exception as e:
+        print(f"set_ai_hooks RPC unavailable, updating row by row: {str(e)}")
+
+    # Same rule as the RPC: never overwrite a hook someone typed in
+    # meanwhile. (The pinned postgrest client has no or_(), hence two
+    # guarded updates; at most one of them matches.)
+    for lead_id, hook in hooks.items():
+        execute(supabase.table("leads").update({"ai_hooks": hook}).eq("id", lead_id).is_("ai_hooks", "null"))
+        execute(supabase.table("leads").update({"ai_hooks": hook}).eq("id", lead_id).eq("ai_hooks", ""))
+
+def generate_hooks(list_name, concurrency=HOOK_CONCURRENCY, rpm=HOOK_RPM, backend="groq", limit=None):
+    leads = leads_missing_hooks(list_name)
+    path = checkpoint_path(list_name)
+    checkpointed = load_checkpoint(path)
+
+    # Hooks generated by an interrupted run go in first
+    missing = {lead["id"] for lead in leads}
+    write_hooks({k: v for k, v in checkpointed.items() if k in missing})
+    todo = [lead for lead in leads if lead["id"] not in checkpointed]
+    if limit:
+        todo = todo[:limit]
+    print(f"{len(leads)} leads in '{list_name}' lack a hook; {len(todo)} to generate "
+          f"({len(missing & checkpointed.keys())} restored from {path})")
+
+    limiter = RateLimiter(rpm)
+    batch = {}
+    generated = failed = 0
+    start = time.monotonic()
+
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        with open(path, "a") as checkpoint:
+            futures = {pool.submit(generate_hook, lead, backend, limiter): lead for lead in todo}
+            for future in as_completed(futures):
+                lead = futures[future]
+                try:
+                    hook = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"Failed to generate hook for lead {lead['id']}: {str(e)}")
+                    continue
+
+                checkpoint.write(json.dumps({"id": lead["id"], "hook": hook}) + "\n")
+                checkpoint.flush()
+                batch[lead["id"]] = hook
+                generated += 1
+                if len(batch) >= HOOK_BATCH_SIZE:
+                    write_hooks(batch)
+                    batch = {}
+                    print(f"{generated}/{len(todo)} hooks written ({generated / (time.monotonic() - start):.1f}/s)")
+    finally:
+        # On Ctrl-C or a failed write, don't keep generating hooks nobody records
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    write_hooks(batch)
+    # Everything generated is now in the database
+    os.remove(path)
+    print(f"✅ Generated {generated} hooks in {time.monotonic() - start:.0f}s. Failed: {failed}")
+    return generated, failed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate ai_hooks for leads in a list that lack one")
+    parser.add_argument("list_name")
+    parser.add_argument("--concurrency", type=int, default=HOOK_CONCURRENCY)
+    parser.add_argument("--rpm", type=float, default=HOOK_RPM, help="max requests per minute (0 = unlimited)")
+    parser.add_argument("--backend", choices=["groq", "github"], default="groq")
+    parser.add_argument("--limit", type=int, help="only generate this many hooks")
+    args = parser.parse_args()
+    generated, failed = generate_hooks(args.list_name, args.concurrency, args.rpm, args.backend, args.limit)
+    sys.exit(1 if failed and not generated else 0)
@@ -0,0 +1,101 @@
+# kit_cache.py
+import os
+import json
+import hashlib
+import tempfile
+import threading
+
+# Generated closing kits on disk, keyed on a hash of the normalized form data
+# plus the template versions, so the key doubles as the response's ETag. The
+# store is bounded by KIT_CACHE_MAX_BYTES and evicts the least recently used
+# kits (by file mtime, which a hit refreshes).
+KIT_CACHE_DIR = os.environ.get('KIT_CACHE_DIR', os.path.join(tempfile.gettempdir(), "closing_kits"))
+KIT_CACHE_MAX_BYTES = int(os.environ.get('KIT_CACHE_MAX_BYTES', 100 * 1024 * 1024))
+
+def kit_key(context, versions):
+    payload = json.dumps({"data": context, "templates": versions}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class KitCache:
+    def __init__(self, directory=KIT_CACHE_DIR, max_bytes=KIT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._evict_lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".zip")
+
+    def get(self, key):
+        """Path of the cached kit, or None"""
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def tee(self, key, chunks, complete):
+        """
+        Pass chunks through while writing them to the cache. The file is
+        only published if the stream ran to the end and complete() is true,
+        so kits with a failed document or an aborted download aren't kept.
+        """
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            f = os.fdopen(fd, "wb")
+        except OSError as e:
+            print(f"Error opening kit cache entry: {str(e)}")
+            yield from chunks
+            return
+
+        finished = False
+        try:
+            for chunk in chunks:
+                if f is not None:
+                    try:
+                        f.write(chunk)
+                    except OSError as e:
+                        print(f"Error writing kit cache entry: {str(e)}")
+                        f.close()
+                        f = None
+                yield chunk
+            finished = True
+        finally:
+            if f is not None:
+                f.close()
+            if finished and f is not None and complete():
+                os.replace(tmp, path)
+                self._evict()
+            else:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+
+    def _evict(self):
+        """Drop least recently used kits until the store fits max_bytes"""
+        with self._evict_lock:
+            entries = []
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if not name.endswith(".zip"):
+                        continue
+                    try:
+                        stat = os.stat(os.path.join(root, name))
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+KIT_CACHE = KitCache()
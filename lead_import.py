@@ -0,0 +1,117 @@
+# lead_import.py
+import csv
+import io
+
+# Uploads come from spreadsheets saved in whatever encoding the user's
+# machine uses; utf-8-sig also strips the BOM Excel adds
+ENCODINGS = ('utf-8-sig', 'latin-1', 'windows-1252', 'iso-8859-1')
+
+HEADER_ALIASES = {
+    # AI hooks
+    "ai hook": "ai hooks",
+    "ai hooks": "ai hooks",
+    "ai_hook": "ai hooks",
+
+    # Last sale
+    "lastsale": "last sale",
+    "last sale": "last sale",
+    "last_sale": "last sale",
+
+    # Open house
+    "openhouse": "open house",
+    "open house": "open house",
+    "open_house": "open house",
+
+    # Name variants
+    "lastname": "last name",
+    "last_name": "last name",
+}
+
+STANDARD_FIELDS = {
+    "email",
+    "name",
+    "last name",
+    "city",
+    "brokerage",
+    "service",
+    "street",
+    "ai hooks",
+    "open house",
+    "last sale",
+}
+
+class LeadImportError(ValueError):
+    """The upload can't be imported at all (as opposed to skipped rows)"""
+
+def decode_csv(raw):
+    for enc in ENCODINGS:
+        try:
+            return raw.decode(enc)
+        except UnicodeDecodeError:
+            continue
+    return raw.decode('latin-1')
+
+def parse_leads(raw, list_name, check_deliverability=True):
+    """
+    Parse an uploaded CSV (bytes) into lead rows for the leads table.
+    Headers are normalized, values trimmed, invalid emails skipped and
+    duplicates collapsed by email (last wins). check_deliverability=False
+    skips email_validator's DNS lookup per address (syntax only).
+    """
+    from email_validator import validate_email, EmailNotValidError
+
+    reader = csv.DictReader(io.StringIO(decode_csv(raw)))
+
+    if not reader.fieldnames:
+        raise LeadImportError("CSV has no headers")
+
+    if 'email' not in [h.lower() for h in reader.fieldnames]:
+        raise LeadImportError("CSV must contain an email column")
+
+    leads_by_email = {}
+
+    for row in reader:
+        if not row:
+            continue
+
+        # Normalize keys + trim values
+        cleaned = {}
+        for k, v in row.items():
+            if not k:
+                continue
+            key = k.strip().lower()
+            key = HEADER_ALIASES.get(key, key)
+            cleaned[key] = v.strip() if v else ""
+
+        email = cleaned.get("email", "").lower()
+        if not email:
+            continue
+
+        # Validate email
+        try:
+            validate_email(email, check_deliverability=check_deliverability)
+        except EmailNotValidError:
+            continue
+
+        # Extract custom fields
+        custom_fields = {
+            k: v for k, v in cleaned.items()
+            if k not in STANDARD_FIELDS
+        }
+
+        leads_by_email[email] = {
+            "email": email,
+            "name": cleaned.get("name", ""),
+            "last_name": cleaned.get("last name", ""),
+            "city": cleaned.get("city", ""),
+            "brokerage": cleaned.get("brokerage", ""),
+            "service": cleaned.get("service", ""),
+            "street": cleaned.get("street", ""),
+            "ai_hooks": cleaned.get("ai hooks", ""),
+            "open_house": cleaned.get("open house", ""),
+            "last_sale": cleaned.get("last sale", ""),
+            "list_name": list_name,
+            "custom_fields": custom_fields
+        }
+
+    return list(leads_by_email.values())
@@ -0,0 +1,126 @@
+# lead_summary.py
+import os
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from db import supabase, execute
+from ai_usage import with_pending
+
+# Combined lead detail document for the admin UI. The queries behind it run
+# concurrently, and the result is cached per lead for LEAD_SUMMARY_TTL
+# seconds. The admin app's own writes invalidate it; writes from other
+# processes (click tracking, worker.py, check_replies.py) don't, so a
+# summary can be up to LEAD_SUMMARY_TTL seconds stale.
+LEAD_SUMMARY_TTL = float(os.environ.get('LEAD_SUMMARY_TTL', 30))
+LEAD_SUMMARY_CACHE_SIZE = 1000
+
+_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="lead-summary")
+_cache = {}
+_cache_lock = threading.Lock()
+
+def _submit(fn, *args):
+    # Run in a copy of this context so tracing's per-request call counting
+    # sees the queries made on the pool threads
+    return _pool.submit(contextvars.copy_context().run, fn, *args)
+
+# ---------- Queries ----------
+def _lead_and_usage(lead_id):
+    """The lead row and its AI demo usage (looked up by email, so sequential)"""
+    lead = execute(supabase.table("leads").select("*").eq("id", lead_id))
+    if not lead.data:
+        return None, None
+    email = lead.data[0]["email"]
+    usage = execute(supabase.table("ai_demo_usage").select("*").eq("email", email))
+    return lead.data[0], with_pending(usage.data[0] if usage.data else None, lead_id, email)
+
+def _clicks(lead_id):
+    return execute(
+        supabase.table("link_clicks")
+        .select("*, campaigns(name)")
+        .eq("lead_id", lead_id)
+        .order("clicked_at", desc=True)
+    ).data
+
+def _queue(lead_id):
+    return execute(
+        supabase.table("email_queue")
+        .select("id, campaign_id, sequence, status, scheduled_for, sent_at, sent_from, attempts, last_error")
+        .eq("lead_id", lead_id)
+        .order("scheduled_for")
+    ).data
+
+def _reply(lead_id):
+    return execute(
+        supabase.table("responded_leads")
+        .select("*")
+        .eq("original_lead_id", lead_id)
+    ).data
+
+def queue_status(rows):
+    """Counts by state plus the next scheduled and last sent email"""
+    queued = [r for r in rows if not r.get("sent_at") and (r.get("status") or "queued") == "queued"]
+    sent = [r for r in rows if r.get("sent_at")]
+    return {
+        "queued": len(queued),
+        "sent": len(sent),
+        "dead": sum(1 for r in rows if r.get("status") == "dead"),
+        "next_scheduled": min(queued, key=lambda r: r["scheduled_for"], default=None),
+        "last_sent": max(sent, key=lambda r: r["sent_at"], default=None),
+        "emails": rows,
+    }
+
+def build_summary(lead_id):
+    lead_and_usage = _submit(_lead_and_usage, lead_id)
+    clicks = _submit(_clicks, lead_id)
+    queue = _submit(_queue, lead_id)
+    reply = _submit(_reply, lead_id)
+
+    lead, usage = lead_and_usage.result()
+    if lead is None:
+        for future in (clicks, queue, reply):
+            future.cancel()
+        return None
+
+    replies = reply.result()
+    return {
+        "lead": lead,
+        "clicks": clicks.result(),
+        "ai_usage": usage,
+        "queue": queue_status(queue.result()),
+        "reply": {
+            "responded": bool(lead.get("responded")),
+            "responded_at": lead.get("responded_at"),
+            "responded_lead": replies[0] if replies else None,
+        },
+    }
+
+# ---------- Cache ----------
+def get_summary(lead_id):
+    """(summary or None if the lead doesn't exist, served from cache)"""
+    now = time.monotonic()
+    with _cache_lock:
+        hit = _cache.get(lead_id)
+        if hit and hit[0] > now:
+            return hit[1], True
+
+    summary = build_summary(lead_id)
+    if summary is not None:
+        with _cache_lock:
+            if len(_cache) >= LEAD_SUMMARY_CACHE_SIZE:
+                for key in [k for k, (expires, _) in _cache.items() if expires <= now] or list(_cache)[:len(_cache) // 2]:
+                    del _cache[key]
+            _cache[lead_id] = (now + LEAD_SUMMARY_TTL, summary)
+    return summary, False
+
+def invalidate_lead(lead_id):
+    try:
+        lead_id = int(lead_id)
+    except (ValueError, TypeError):
+        return
+    with _cache_lock:
+        _cache.pop(lead_id, None)
+
+def invalidate_all():
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,187 @@
+# metrics.py
+import time
+import threading
+from contextlib import contextmanager
+
+# Default histogram buckets in seconds, from fast DB calls to slow SMTP sessions
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def _label_key(labels):
+    return ",".join(f'{k}="{labels[k]}"' for k in sorted(labels))
+
+def _with_le(key, le):
+    return f'{key},le="{le}"' if key else f'le="{le}"'
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q):
+        """Estimate a quantile from the buckets (upper bound of the bucket)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+class Registry:
+    """In-process counters and histograms, exportable as Prometheus text"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.help = {}
+        self.counters = {}
+        self.histograms = {}
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """JSON-serializable copy of every series"""
+        with self._lock:
+            return {
+                "help": dict(self.help),
+                "counters": {name: dict(series) for name, series in self.counters.items()},
+                "histograms": {
+                    name: {
+                        key: {"buckets": list(h.buckets), "counts": list(h.counts), "sum": h.sum, "count": h.count}
+                        for key, h in series.items()
+                    }
+                    for name, series in self.histograms.items()
+                },
+            }
+
+    def render(self):
+        return render_snapshot(self.snapshot())
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+def render_snapshot(snapshot):
+    """Render a Registry snapshot in the Prometheus text exposition format"""
+    lines = []
+    helps = snapshot.get("help", {})
+
+    for name, series in sorted(snapshot.get("counters", {}).items()):
+        if name in helps:
+            lines.append(f"# HELP {name} {helps[name]}")
+        lines.append(f"# TYPE {name} counter")
+        for key, value in sorted(series.items()):
+            lines.append(f"{name}{{{key}}} {value}" if key else f"{name} {value}")
+
+    for name, series in sorted(snapshot.get("histograms", {}).items()):
+        if name in helps:
+            lines.append(f"# HELP {name} {helps[name]}")
+        lines.append(f"# TYPE {name} histogram")
+        for key, h in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(h["buckets"], h["counts"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{{{_with_le(key, bound)}}} {cumulative}")
+            lines.append(f"{name}_bucket{{{_with_le(key, '+Inf')}}} {h['count']}")
+            suffix = f"{{{key}}}" if key else ""
+            lines.append(f"{name}_sum{suffix} {h['sum']:.6f}")
+            lines.append(f"{name}_count{suffix} {h['count']}")
+
+    return "\n".join(lines) + "\n"
+
+def render_last_run(snapshot, prefix="worker_"):
+    """
+    Render a stored snapshot of one finished run as gauges. Each run counts
+    from zero, so its values can't be exported as counters: every run would
+    look like a counter reset and break rate()/increase(). Metric names
+    become <prefix>last_run_<rest> with any _total suffix dropped, and the
+    run's finished_at (if recorded) becomes <prefix>last_run_timestamp_seconds.
+    """
+    lines = []
+    helps = snapshot.get("help", {})
+
+    def rename(name):
+        rest = name[len(prefix):] if name.startswith(prefix) else name
+        if rest.endswith("_total"):
+            rest = rest[:-len("_total")]
+        return f"{prefix}last_run_{rest}"
+
+    def header(name, gauge):
+        if name in helps:
+            lines.append(f"# HELP {gauge} {helps[name]}")
+        lines.append(f"# TYPE {gauge} gauge")
+
+    if snapshot.get("finished_at") is not None:
+        lines.append(f"# HELP {prefix}last_run_timestamp_seconds Unix time the last run finished")
+        lines.append(f"# TYPE {prefix}last_run_timestamp_seconds gauge")
+        lines.append(f"{prefix}last_run_timestamp_seconds {snapshot['finished_at']:.3f}")
+
+    for name, series in sorted(snapshot.get("counters", {}).items()):
+        gauge = rename(name)
+        header(name, gauge)
+        for key, value in sorted(series.items()):
+            lines.append(f"{gauge}{{{key}}} {value}" if key else f"{gauge} {value}")
+
+    for name, series in sorted(snapshot.get("histograms", {}).items()):
+        gauge = rename(name)
+        for part in ("bucket", "sum", "count"):
+            header(name, f"{gauge}_{part}")
+            for key, h in sorted(series.items()):
+                suffix = f"{{{key}}}" if key else ""
+                if part == "bucket":
+                    cumulative = 0
+                    for bound, count in zip(h["buckets"], h["counts"]):
+                        cumulative += count
+                        lines.append(f"{gauge}_bucket{{{_with_le(key, bound)}}} {cumulative}")
+                    lines.append(f"{gauge}_bucket{{{_with_le(key, '+Inf')}}} {h['count']}")
+                elif part == "sum":
+                    lines.append(f"{gauge}_sum{suffix} {h['sum']:.6f}")
+                else:
+                    lines.append(f"{gauge}_count{suffix} {h['count']}")
+
+    return "\n".join(lines) + "\n" if lines else ""
+
+def summary_line(snapshot, histogram):
+    """One-line 'stage=count/total' summary of a histogram, for logs"""
+    parts = []
+    for key, h in sorted(snapshot.get("histograms", {}).get(histogram, {}).items()):
+        label = key.split("=", 1)[-1].strip('"') if key else "all"
+        parts.append(f"{label}={h['count']}x/{h['sum']:.3f}s")
+    return " ".join(parts)
+
+REGISTRY = Registry()
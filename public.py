@@ -1,14 +1,11 @@
 # public.py
 
 import os
-import zipfile
-import tempfile
-import uuid
-from io import BytesIO
 
-from flask import Blueprint, request, send_file, jsonify, render_template, abort
+from flask import Blueprint, Response, request, send_file, jsonify, render_template, abort
 from flask_cors import CORS
-from docxtpl import DocxTemplate
+from closing_kit import KIT_DOCUMENTS, kit_context, stream_kit, template_versions
+from kit_cache import KIT_CACHE, kit_key
 
 public_bp = Blueprint("public", __name__)
 # Allow CORS for demo endpoints
@@ -47,45 +44,18 @@ def generate_reply_prompt():
 
     try:
         from utils import callAIML_from_flask
-        full_response = callAIML_from_flask(enhanced_prompt)
-        
-        # Parse the response to extract reply and follow-ups
-        sections = {}
-        current_section = None
-        lines = full_response.split('\n')
-        
-        for line in lines:
-            line = line.strip()
-            if line == "=== REPLY ===":
-                current_section = 'reply'
-                sections[current_section] = []
-            elif line == "=== FOLLOW UP 1 ===":
-                current_section = 'follow_up_1'
-                sections[current_section] = []
-            elif line == "=== FOLLOW UP 2 ===":
-                current_section = 'follow_up_2'
-                sections[current_section] = []
-            elif line == "=== FOLLOW UP 3 ===":
-                current_section = 'follow_up_3'
-                sections[current_section] = []
-            elif current_section and line:
-                sections[current_section].append(line)
-        
-        # Join the lines for each section
-        reply = ' '.join(sections.get('reply', [])).strip()
-        follow_ups = [
-            ' '.join(sections.get('follow_up_1', [])).strip(),
-            ' '.join(sections.get('follow_up_2', [])).strip(),
-            ' '.join(sections.get('follow_up_3', [])).strip()
-        ]
-        
-        # Remove any empty follow-ups
-        follow_ups = [fu for fu in follow_ups if fu]
-        
-        return jsonify({
-            "reply": reply,
-            "follow_ups": follow_ups
-        })
+        from ai_reply import parse_sections
+        from reply_cache import cached_reply
+
+        model = os.environ.get("GH_MODELS", "openai/gpt-4o-mini")
+        result, hit = cached_reply(
+            enhanced_prompt, model, {"backend": "github-models"},
+            lambda: parse_sections(callAIML_from_flask(enhanced_prompt))
+        )
+
+        response = jsonify(result)
+        response.headers["X-Cache"] = "HIT" if hit else "MISS"
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -106,117 +76,36 @@ def generate_full_kit():
         return ("", 204)
 
     try:
-        data = request.get_json(force=True)
-        
-        # Set default values for any missing fields
-        defaults = {
-            "transaction_type": "Purchase",
-            "rent_type": "Annual Lease",
-            "inspection_days": 10,
-            "mortgage_years": 30,
-            "interest_rate": 3.5,
-            "parking_spaces": 1,
-            "broker_name": "John Smith",
-        }
-        
-        for key, value in defaults.items():
-            if key not in data or not data[key]:
-                data[key] = value
-        
-        # Generate all documents
-        documents = []
-        
-        # LOI
-        try:
-            loi_tpl = DocxTemplate("templates/transaction_autopilot/loi_template.docx")
-            loi_tpl.render(data)
-            loi_bio = BytesIO()
-            loi_tpl.save(loi_bio)
-            loi_bio.seek(0)
-            documents.append(("Letter_of_Intent.docx", loi_bio))
-        except Exception as e:
-            print(f"Error generating LOI: {e}")
-        
-        # PSA
-        try:
-            psa_tpl = DocxTemplate("templates/transaction_autopilot/psa_template.docx")
-            psa_tpl.render(data)
-            psa_bio = BytesIO()
-            psa_tpl.save(psa_bio)
-            psa_bio.seek(0)
-            documents.append(("Purchase_Sale_Agreement.docx", psa_bio))
-        except Exception as e:
-            print(f"Error generating PSA: {e}")
-        
-        # Purchase Offer
-        try:
-            purchase_offer_tpl = DocxTemplate("templates/transaction_autopilot/purchase_offer_template.docx")
-            purchase_offer_tpl.render(data)
-            purchase_offer_bio = BytesIO()
-            purchase_offer_tpl.save(purchase_offer_bio)
-            purchase_offer_bio.seek(0)
-            documents.append(("Purchase_Offer.docx", purchase_offer_bio))
-        except Exception as e:
-            print(f"Error generating Purchase Offer: {e}")
-        
-        # Agency Disclosure
-        try:
-            agency_tpl = DocxTemplate("templates/transaction_autopilot/agency_disclosure_template.docx")
-            agency_tpl.render(data)
-            agency_bio = BytesIO()
-            agency_tpl.save(agency_bio)
-            agency_bio.seek(0)
-            documents.append(("Agency_Disclosure.docx", agency_bio))
-        except Exception as e:
-            print(f"Error generating Agency Disclosure: {e}")
-        
-        # Real Estate Purchase Agreement
-        try:
-            purchase_tpl = DocxTemplate("templates/transaction_autopilot/real_estate_purchase_template.docx")
-            purchase_tpl.render(data)
-            purchase_bio = BytesIO()
-            purchase_tpl.save(purchase_bio)
-            purchase_bio.seek(0)
-            documents.append(("Real_Estate_Purchase_Agreement.docx", purchase_bio))
-        except Exception as e:
-            print(f"Error generating Real Estate Purchase Agreement: {e}")
-        
-        # Lease Agreement
-        try:
-            lease_tpl = DocxTemplate("templates/transaction_autopilot/lease_template.docx")
-            lease_tpl.render(data)
-            lease_bio = BytesIO()
-            lease_tpl.save(lease_bio)
-            lease_bio.seek(0)
-            documents.append(("Lease_Agreement.docx", lease_bio))
-        except Exception as e:
-            print(f"Error generating Lease Agreement: {e}")
-        
-        # Seller Disclosure
-        try:
-            seller_tpl = DocxTemplate("templates/transaction_autopilot/seller_disclosure_template.docx")
-            seller_tpl.render(data)
-            seller_bio = BytesIO()
-            seller_tpl.save(seller_bio)
-            seller_bio.seek(0)
-            documents.append(("Seller_Disclosure.docx", seller_bio))
-        except Exception as e:
-            print(f"Error generating Seller Disclosure: {e}")
-
-        # Create a ZIP file in memory
-        zip_io = BytesIO()
-        with zipfile.ZipFile(zip_io, 'w') as zip_file:
-            for filename, file_bio in documents:
-                zip_file.writestr(filename, file_bio.getvalue())
-        
-        zip_io.seek(0)
-        
-        return send_file(
-            zip_io,
-            as_attachment=True,
-            download_name=f"complete_closing_kit_{data.get('id', 'demo')}.zip",
-            mimetype="application/zip"
+        data = kit_context(request.get_json(force=True))
+        filename = f"complete_closing_kit_{data.get('id', 'demo')}.zip"
+
+        # The same form data and templates always give the same kit, so the
+        # cache key is also a strong ETag. It's only sent for a cached kit:
+        # a streamed one may still turn out incomplete.
+        key = kit_key(data, template_versions())
+        path = KIT_CACHE.get(key)
+        if path:
+            if request.if_none_match.contains(key):
+                response = Response(status=304)
+                response.set_etag(key)
+                return response
+            response = send_file(path, mimetype="application/zip", as_attachment=True,
+                                 download_name=filename, etag=key)
+            response.headers["X-Cache"] = "HIT"
+            return response
+
+        # Documents render in parallel and are zipped to the client as
+        # each one finishes; a complete kit is kept for next time
+        written = []
+        chunks = KIT_CACHE.tee(key, stream_kit(data, written),
+                               lambda: len(written) == len(KIT_DOCUMENTS))
+        response = Response(
+            (chunk for chunk in chunks if chunk),
+            mimetype="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
         )
+        response.headers["X-Cache"] = "MISS"
+        return response
         
     except Exception as e:
         print(f"Error in generate_full_kit: {e}")
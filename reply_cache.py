@@ -0,0 +1,189 @@
+# reply_cache.py
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Generated demo replies, keyed on the normalized prompt plus model and
+# sampling parameters. The in-memory tier is an LRU bounded by entry count
+# and total size; REPLY_CACHE_DIR adds a disk tier (e.g. /tmp on Vercel) so
+# entries survive a cold start on the same instance. Each write to the disk
+# tier deletes expired files and then the oldest ones until it fits
+# REPLY_CACHE_DISK_MAX_BYTES.
+REPLY_CACHE_SIZE = int(os.environ.get('REPLY_CACHE_SIZE', 512))
+REPLY_CACHE_MAX_BYTES = int(os.environ.get('REPLY_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+REPLY_CACHE_TTL = int(os.environ.get('REPLY_CACHE_TTL', 24 * 3600))
+REPLY_CACHE_DIR = os.environ.get('REPLY_CACHE_DIR', '')
+REPLY_CACHE_DISK_MAX_BYTES = int(os.environ.get('REPLY_CACHE_DISK_MAX_BYTES', 64 * 1024 * 1024))
+
+def normalize_prompt(prompt):
+    """Collapse whitespace so re-pasted sample emails hit the same entry"""
+    return " ".join(prompt.split())
+
+def cache_key(prompt, model, params=None):
+    payload = json.dumps(
+        {"prompt": normalize_prompt(prompt), "model": model, "params": params or {}},
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ReplyCache:
+    def __init__(self, max_entries=REPLY_CACHE_SIZE, max_bytes=REPLY_CACHE_MAX_BYTES,
+                 ttl=REPLY_CACHE_TTL, directory=REPLY_CACHE_DIR, disk_max_bytes=REPLY_CACHE_DISK_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self._prune_lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # ---------- Memory tier ----------
+    def _evict(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _remember(self, key, value, expires):
+        size = len(json.dumps(value))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+            self._entries[key] = (value, expires, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._evict(next(iter(self._entries)))
+
+    # ---------- Disk tier ----------
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def _read_disk(self, key):
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("expires", 0) <= time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry
+
+    def _write_disk(self, key, value, expires):
+        import tempfile
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump({"expires": expires, "value": value}, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Error writing reply cache entry: {str(e)}")
+            return
+        self._prune_disk()
+
+    def _prune_disk(self):
+        """
+        Delete expired entries, then the oldest until the disk tier fits
+        disk_max_bytes. A file is written when its entry is set, so its
+        mtime plus the TTL is when it expires.
+        """
+        with self._prune_lock:
+            now = time.time()
+            entries = []
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if not name.endswith(".json"):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    if stat.st_mtime + self.ttl <= now:
+                        try:
+                            os.remove(path)
+                        except OSError:
+                            pass
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.disk_max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+    # ---------- API ----------
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit and hit[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return hit[0]
+            if hit:
+                self._evict(key)
+
+        if self.directory:
+            entry = self._read_disk(key)
+            if entry:
+                self._remember(key, entry["value"], entry["expires"])
+                with self._lock:
+                    self.hits += 1
+                return entry["value"]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        expires = time.time() + self.ttl
+        self._remember(key, value, expires)
+        if self.directory:
+            self._write_disk(key, value, expires)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+REPLY_CACHE = ReplyCache()
+
+def cached_reply(prompt, model, params, generate):
+    """
+    Return (parsed reply, hit). generate() is only called on a miss and
+    must return the parsed {"reply", "follow_ups"} dict, so hits skip both
+    the model call and the section parsing. Empty replies aren't cached.
+    """
+    key = cache_key(prompt, model, params)
+    cached = REPLY_CACHE.get(key)
+    if cached is not None:
+        return cached, True
+
+    result = generate()
+    if result.get("reply"):
+        REPLY_CACHE.set(key, result)
+    return result, False
@@ -0,0 +1,119 @@
+# send_limits.py
+import os
+import math
+from datetime import date, datetime, timedelta, timezone
+from db import execute
+
+# Token bucket per sending account. The bucket holds at most SEND_BURST
+# sends and refills continuously at SEND_REFILL_PER_HOUR, so capacity comes
+# back over the day instead of all at once at midnight.
+SEND_BURST = int(os.environ.get("SEND_BURST", 100))
+SEND_REFILL_PER_HOUR = float(os.environ.get("SEND_REFILL_PER_HOUR", 100 / 24))
+
+# Warm-up defaults for accounts with a warmup_start_date: start at
+# WARMUP_INITIAL_LIMIT sends a day and add WARMUP_DAILY_INCREASE each day
+# until the account's daily_limit is reached.
+WARMUP_INITIAL_LIMIT = int(os.environ.get("WARMUP_INITIAL_LIMIT", 10))
+WARMUP_DAILY_INCREASE = int(os.environ.get("WARMUP_DAILY_INCREASE", 5))
+
+def _parse_ts(value):
+    ts = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts
+
+def lookback_window(burst=SEND_BURST, refill_per_hour=SEND_REFILL_PER_HOUR):
+    """How far back send history matters: the time to refill an empty bucket"""
+    return timedelta(hours=burst / refill_per_hour)
+
+def account_limit(account, today=None):
+    """
+    Daily send limit for an account: its configured daily_limit (default
+    SEND_BURST), capped by the warm-up ramp while the account is new.
+    """
+    limit = account.get("daily_limit")
+    if limit is None:
+        limit = SEND_BURST
+
+    start = account.get("warmup_start_date")
+    if start:
+        today = today or datetime.now(timezone.utc).date()
+        start = date.fromisoformat(str(start)[:10])
+        days = max(0, (today - start).days)
+        initial = account.get("warmup_initial_limit") or WARMUP_INITIAL_LIMIT
+        increase = account.get("warmup_daily_increase") or WARMUP_DAILY_INCREASE
+        limit = min(limit, initial + increase * days)
+
+    return max(0, int(limit))
+
+def account_bucket(account, today=None):
+    """
+    Token bucket (burst, refill per hour) for an account. The bucket is sized
+    to the account's limit and refills at the configured SEND_BURST /
+    SEND_REFILL_PER_HOUR ratio, so every account shares one lookback window.
+    """
+    limit = account_limit(account, today)
+    return limit, limit * SEND_REFILL_PER_HOUR / SEND_BURST
+
+def available_tokens(sent_times, now=None, burst=SEND_BURST, refill_per_hour=SEND_REFILL_PER_HOUR):
+    """
+    Replay an account's send timestamps through a token bucket and return
+    how many sends it can make right now. The bucket is assumed full at the
+    start of the lookback window.
+    """
+    now = now or datetime.now(timezone.utc)
+    if burst <= 0:
+        return 0
+    rate = refill_per_hour / 3600
+    last = now - lookback_window(burst, refill_per_hour)
+    tokens = float(burst)
+
+    for sent_at in sorted(t for t in sent_times if t > last):
+        tokens = min(burst, tokens + (sent_at - last).total_seconds() * rate) - 1
+        last = sent_at
+
+    tokens = min(burst, tokens + (now - last).total_seconds() * rate)
+    return max(0, math.floor(tokens))
+
+def fetch_send_history(supabase, now=None):
+    """Get recent send timestamps for every account from email_queue"""
+    now = now or datetime.now(timezone.utc)
+    since = (now - lookback_window()).isoformat()
+
+    history = {}
+    PAGE_SIZE = 1000
+    offset = 0
+    while True:
+        page = execute(
+            supabase.table("email_queue")
+            .select("sent_from, sent_at")
+            .gte("sent_at", since)
+            .not_.is_("sent_from", "null")
+            .order("sent_at")
+            .range(offset, offset + PAGE_SIZE - 1)
+        )
+        for row in page.data:
+            history.setdefault(row["sent_from"], []).append(_parse_ts(row["sent_at"]))
+        if len(page.data) < PAGE_SIZE:
+            break
+        offset += PAGE_SIZE
+    return history
+
+def account_capacity(supabase, accounts, now=None):
+    """
+    Return {account email: {"limit": n, "sent_recent": n, "remaining": n}}
+    where sent_recent counts sends inside the lookback window.
+    """
+    now = now or datetime.now(timezone.utc)
+    history = fetch_send_history(supabase, now)
+
+    capacity = {}
+    for account in accounts:
+        sent_times = history.get(account["email"], [])
+        burst, refill_per_hour = account_bucket(account, now.date())
+        capacity[account["email"]] = {
+            "limit": burst,
+            "sent_recent": len(sent_times),
+            "remaining": available_tokens(sent_times, now, burst, refill_per_hour)
+        }
+    return capacity
@@ -0,0 +1,23 @@
+-- Applies every reply-side state change for a batch of leads in one
+-- transaction. Called by check_replies.py once per poll cycle.
+create or replace function mark_leads_responded(p_lead_ids bigint[])
+returns void
+language plpgsql
+as $$
+begin
+  insert into responded_leads
+    (original_lead_id, email, name, last_name, city, brokerage, service, list_name, custom_fields)
+  select id, email, name, last_name, city, brokerage, service, list_name, custom_fields
+  from leads
+  where id = any(p_lead_ids);
+
+  delete from email_queue where lead_id = any(p_lead_ids);
+
+  delete from lead_campaign_accounts where lead_id = any(p_lead_ids);
+
+  update leads
+  set responded = true,
+      responded_at = now()
+  where id = any(p_lead_ids);
+end;
+$$;
@@ -0,0 +1,31 @@
+-- Message-ID stamped on every outgoing email by worker.py. check_replies.py
+-- matches In-Reply-To/References headers against this index.
+alter table email_queue add column if not exists message_id text;
+
+create unique index if not exists email_queue_message_id_idx
+  on email_queue (message_id)
+  where message_id is not null;
+
+-- Keep sent rows when a lead responds so later replies in the same thread
+-- still resolve through message_id; only unsent mail is dropped.
+create or replace function mark_leads_responded(p_lead_ids bigint[])
+returns void
+language plpgsql
+as $$
+begin
+  insert into responded_leads
+    (original_lead_id, email, name, last_name, city, brokerage, service, list_name, custom_fields)
+  select id, email, name, last_name, city, brokerage, service, list_name, custom_fields
+  from leads
+  where id = any(p_lead_ids);
+
+  delete from email_queue where lead_id = any(p_lead_ids) and sent_at is null;
+
+  delete from lead_campaign_accounts where lead_id = any(p_lead_ids);
+
+  update leads
+  set responded = true,
+      responded_at = now()
+  where id = any(p_lead_ids);
+end;
+$$;
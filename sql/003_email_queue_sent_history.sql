@@ -0,0 +1,5 @@
+-- send_limits.py replays each account's recent sends from email_queue.
+-- daily_email_counts and reset_daily_counts.py are no longer used.
+create index if not exists email_queue_sent_from_sent_at_idx
+  on email_queue (sent_at, sent_from)
+  where sent_at is not null;
@@ -0,0 +1,7 @@
+-- Per-account send limits used by send_limits.py. A null daily_limit falls
+-- back to SEND_BURST; accounts with a warmup_start_date ramp up from
+-- warmup_initial_limit by warmup_daily_increase per day (env defaults when null).
+alter table smtp_accounts add column if not exists daily_limit integer;
+alter table smtp_accounts add column if not exists warmup_start_date date;
+alter table smtp_accounts add column if not exists warmup_initial_limit integer;
+alter table smtp_accounts add column if not exists warmup_daily_increase integer;
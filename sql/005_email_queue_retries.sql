@@ -0,0 +1,10 @@
+-- Retry bookkeeping for worker.py. Failed sends are rescheduled with
+-- backoff; permanent failures and rows that exhaust MAX_SEND_ATTEMPTS get
+-- status 'dead' and are no longer picked up.
+alter table email_queue add column if not exists attempts integer not null default 0;
+alter table email_queue add column if not exists last_error text;
+alter table email_queue add column if not exists status text not null default 'queued';
+
+create index if not exists email_queue_due_idx
+  on email_queue (scheduled_for)
+  where sent_at is null and status = 'queued';
@@ -0,0 +1,64 @@
+-- Optional per-campaign priority: a campaign with priority p gets p + 1
+-- sends per round when campaigns are interleaved.
+alter table campaigns add column if not exists priority integer not null default 0;
+
+create index if not exists lead_campaign_accounts_lead_campaign_idx
+  on lead_campaign_accounts (lead_id, campaign_id);
+
+-- Due emails that can be sent this run, for worker.py.
+-- p_capacity maps account email -> remaining sends. Rows assigned to an
+-- account are capped at that account's capacity (so a saturated account
+-- never blocks the head of the queue), then campaigns are interleaved
+-- round-robin weighted by priority. Each row gets an assigned_account key.
+create or replace function claim_due_emails(p_capacity jsonb, p_limit integer default 100)
+returns jsonb
+language sql
+stable
+as $$
+  with due as (
+    select q.*,
+           lca.smtp_account as assigned_account,
+           coalesce(c.priority, 0) as priority
+    from email_queue q
+    left join lead_campaign_accounts lca
+      on lca.lead_id = q.lead_id and lca.campaign_id = q.campaign_id
+    left join campaigns c on c.id = q.campaign_id
+    where q.sent_at is null
+      and q.status = 'queued'
+      and q.scheduled_for <= now()
+      and (lca.smtp_account is null
+           or coalesce((p_capacity ->> lca.smtp_account)::int, 0) > 0)
+  ),
+  capped as (
+    select due.*,
+           row_number() over (
+             partition by assigned_account
+             order by priority desc, scheduled_for, id
+           ) as account_rank
+    from due
+  ),
+  ranked as (
+    select capped.*,
+           row_number() over (
+             partition by campaign_id
+             order by priority desc, scheduled_for, id
+           )::float / (1 + greatest(priority, 0)) as fair_rank
+    from capped
+    where assigned_account is null
+       or account_rank <= (p_capacity ->> assigned_account)::int
+  ),
+  picked as (
+    select *
+    from ranked
+    order by fair_rank, priority desc, scheduled_for, id
+    limit p_limit
+  )
+  select coalesce(
+    jsonb_agg(
+      to_jsonb(picked) - 'account_rank' - 'fair_rank'
+      order by fair_rank, priority desc, scheduled_for, id
+    ),
+    '[]'::jsonb
+  )
+  from picked;
+$$;
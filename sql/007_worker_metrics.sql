@@ -0,0 +1,10 @@
+-- One row per worker run with its metrics.Registry snapshot; app.py's
+-- /metrics renders the latest one as gauges. worker.py deletes rows older
+-- than WORKER_METRICS_RETENTION_DAYS after each run.
+create table if not exists worker_metrics (
+  id bigint generated always as identity primary key,
+  snapshot jsonb not null,
+  created_at timestamptz not null default now()
+);
+
+create index if not exists worker_metrics_created_at_idx on worker_metrics (created_at desc);
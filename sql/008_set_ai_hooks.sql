@@ -0,0 +1,17 @@
+-- Bulk write-back for generate_hooks.py: p_hooks maps lead id -> hook text.
+-- Only leads that still have no hook are touched, so a hand-written hook
+-- added while the job ran is never overwritten.
+create or replace function set_ai_hooks(p_hooks jsonb)
+returns integer
+language sql
+as $$
+  with updated as (
+    update leads l
+    set ai_hooks = h.value
+    from jsonb_each_text(p_hooks) h
+    where l.id = h.key::bigint
+      and coalesce(l.ai_hooks, '') = ''
+    returning l.id
+  )
+  select count(*)::integer from updated;
+$$;
@@ -0,0 +1,42 @@
+-- Atomic AI demo usage counting for app.py's /api/record-ai-usage.
+-- The old read-then-write path could create duplicate rows per email under
+-- concurrency; fold them into the oldest row before adding the unique index.
+with merged as (
+  select email,
+         min(id) as keep_id,
+         sum(usage_count) as usage_count,
+         min(first_used_at) as first_used_at,
+         max(last_used_at) as last_used_at
+  from ai_demo_usage
+  group by email
+  having count(*) > 1
+)
+update ai_demo_usage u
+set usage_count = m.usage_count,
+    first_used_at = m.first_used_at,
+    last_used_at = m.last_used_at
+from merged m
+where u.id = m.keep_id;
+
+delete from ai_demo_usage a
+using ai_demo_usage b
+where a.email = b.email and a.id > b.id;
+
+create unique index if not exists ai_demo_usage_email_idx on ai_demo_usage (email);
+
+-- p_usage: [{"lead_id", "count", "first_used_at", "last_used_at"}, ...] as
+-- aggregated in memory by ai_usage.py. Unknown lead ids are ignored.
+create or replace function record_ai_usage(p_usage jsonb)
+returns void
+language sql
+as $$
+  insert into ai_demo_usage (lead_id, email, usage_count, first_used_at, last_used_at)
+  select min(l.id), l.email, sum(u.count), min(u.first_used_at), max(u.last_used_at)
+  from jsonb_to_recordset(p_usage)
+       as u(lead_id bigint, count integer, first_used_at timestamptz, last_used_at timestamptz)
+  join leads l on l.id = u.lead_id
+  group by l.email
+  on conflict (email) do update
+  set usage_count = ai_demo_usage.usage_count + excluded.usage_count,
+      last_used_at = greatest(ai_demo_usage.last_used_at, excluded.last_used_at);
+$$;
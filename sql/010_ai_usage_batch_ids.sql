@@ -0,0 +1,40 @@
+-- Makes record_ai_usage safe to retry. ai_usage.py sends every flush with a
+-- batch id; a batch that was already applied (its response lost to a
+-- timeout or 5xx after commit) is skipped instead of counted twice.
+create table if not exists ai_usage_batches (
+  batch_id uuid primary key,
+  applied_at timestamptz not null default now()
+);
+
+create index if not exists ai_usage_batches_applied_at_idx on ai_usage_batches (applied_at);
+
+drop function if exists record_ai_usage(jsonb);
+
+-- Returns false if the batch had already been applied. Batch ids are only
+-- retried for minutes, so ids older than a day are pruned.
+create or replace function record_ai_usage(p_usage jsonb, p_batch_id uuid)
+returns boolean
+language plpgsql
+as $$
+begin
+  insert into ai_usage_batches (batch_id) values (p_batch_id)
+  on conflict (batch_id) do nothing;
+  if not found then
+    return false;
+  end if;
+
+  delete from ai_usage_batches where applied_at < now() - interval '1 day';
+
+  insert into ai_demo_usage (lead_id, email, usage_count, first_used_at, last_used_at)
+  select min(l.id), l.email, sum(u.count), min(u.first_used_at), max(u.last_used_at)
+  from jsonb_to_recordset(p_usage)
+       as u(lead_id bigint, count integer, first_used_at timestamptz, last_used_at timestamptz)
+  join leads l on l.id = u.lead_id
+  group by l.email
+  on conflict (email) do update
+  set usage_count = ai_demo_usage.usage_count + excluded.usage_count,
+      last_used_at = greatest(ai_demo_usage.last_used_at, excluded.last_used_at);
+
+  return true;
+end;
+$$;
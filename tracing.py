@@ -0,0 +1,93 @@
+# tracing.py
+import os
+import time
+import threading
+from collections import deque
+from flask import g, request, jsonify, current_app
+from db import CallStats, current_call_stats
+from metrics import REGISTRY
+
+# Requests slower than this, or making more Supabase calls than this, are
+# logged with their numbers so N+1 queries show up straight away
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 1000))
+QUERY_BUDGET = int(os.environ.get('QUERY_BUDGET', 10))
+# Recent latencies kept per route for percentiles
+ROUTE_SAMPLES = 1000
+
+REQUEST_METRIC = "http_request_seconds"
+DB_CALLS_METRIC = "http_request_db_calls"
+REGISTRY.describe(REQUEST_METRIC, "Flask request latency by route")
+REGISTRY.describe(DB_CALLS_METRIC, "Supabase round-trips per Flask request by route")
+
+_samples = {}
+_samples_lock = threading.Lock()
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def route_percentiles():
+    """{route: {count, p50_ms, p95_ms, p99_ms, avg_db_calls, max_db_calls}} over recent requests"""
+    with _samples_lock:
+        snapshot = {route: list(samples) for route, samples in _samples.items()}
+
+    stats = {}
+    for route, samples in snapshot.items():
+        latencies = sorted(ms for ms, _ in samples)
+        calls = [c for _, c in samples]
+        stats[route] = {
+            "count": len(samples),
+            "p50_ms": round(_percentile(latencies, 0.50), 1),
+            "p95_ms": round(_percentile(latencies, 0.95), 1),
+            "p99_ms": round(_percentile(latencies, 0.99), 1),
+            "avg_db_calls": round(sum(calls) / len(calls), 2),
+            "max_db_calls": max(calls),
+        }
+    return stats
+
+def _before_request():
+    g.trace_start = time.perf_counter()
+    g.trace_stats = CallStats()
+    g.trace_token = current_call_stats.set(g.trace_stats)
+
+def _after_request(response):
+    start = g.get("trace_start")
+    stats = g.get("trace_stats")
+    if start is None:
+        return response
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    size = response.calculate_content_length() if not response.is_streamed else None
+
+    REGISTRY.observe(REQUEST_METRIC, elapsed_ms / 1000, route=route, method=request.method)
+    REGISTRY.observe(DB_CALLS_METRIC, stats.calls, buckets=(0, 1, 2, 5, 10, 20, 50, 100), route=route)
+    with _samples_lock:
+        _samples.setdefault(route, deque(maxlen=ROUTE_SAMPLES)).append((elapsed_ms, stats.calls))
+
+    if elapsed_ms > SLOW_REQUEST_MS or stats.calls > QUERY_BUDGET:
+        current_app.logger.warning(
+            "slow request %s %s: %.0f ms, %d supabase calls (%.0f ms), %s bytes",
+            request.method, request.path, elapsed_ms, stats.calls, stats.seconds * 1000,
+            size if size is not None else "streamed"
+        )
+
+    response.headers["Server-Timing"] = f"app;dur={elapsed_ms:.1f}, db;dur={stats.seconds * 1000:.1f};desc=\"{stats.calls} calls\""
+    return response
+
+def _teardown_request(error=None):
+    token = g.pop("trace_token", None)
+    if token is not None:
+        current_call_stats.reset(token)
+
+def init_tracing(app):
+    """Record latency, Supabase calls and response size for every request"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+    @app.route('/api/request-stats', methods=['GET'])
+    def api_request_stats():
+        return jsonify({"ok": True, "routes": route_percentiles()}), 200
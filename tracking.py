@@ -0,0 +1,80 @@
+# tracking.py
+import urllib.parse
+from flask import Blueprint, request, redirect
+from db import supabase
+
+# Click tracking routes. Kept free of heavy imports so the lightweight
+# api/track.py entry point cold-starts quickly.
+tracking_bp = Blueprint("tracking", __name__)
+
+# Update the route to use integer IDs
+@tracking_bp.route('/track/<lead_id>/<campaign_id>')
+def track_click(lead_id, campaign_id):
+    try:
+        # Get the original URL from query parameters
+        url = request.args.get('url')
+        if not url:
+            return "URL parameter missing", 400
+            
+        # Decode the URL
+        original_url = urllib.parse.unquote(url)
+        
+        # Get the email_queue_id if available
+        email_queue_id = request.args.get('eqid', None)
+        
+        # Convert IDs to integers if possible
+        try:
+            lead_id_int = int(lead_id)
+        except (ValueError, TypeError):
+            lead_id_int = None
+            
+        try:
+            campaign_id_int = int(campaign_id)
+        except (ValueError, TypeError):
+            campaign_id_int = None
+        
+        # Record the click in the database
+        supabase.table("link_clicks").insert({
+            "lead_id": lead_id_int,
+            "campaign_id": campaign_id_int,
+            "url": original_url,
+            "email_queue_id": email_queue_id
+        }).execute()
+        
+        # Redirect to the demo page with lead_id as parameter
+        demo_url = "https://replyzeai.com/goods/templates/demooff"
+        redirect_url = f"{demo_url}?lead_id={lead_id}&campaign_id={campaign_id}"
+        if email_queue_id:
+            redirect_url += f"&eqid={email_queue_id}"
+            
+        return redirect(redirect_url)
+        
+    except Exception as e:
+        print(f"Error tracking click: {str(e)}")
+        return "Error tracking click", 500
+
+@tracking_bp.route('/api/track', methods=['GET'])
+def api_track_click():
+    try:
+        lead_id = request.args.get('lead_id')
+        campaign_id = request.args.get('campaign_id')
+        url = request.args.get('url')
+        email_queue_id = request.args.get('eqid', None)
+        
+        if not all([lead_id, campaign_id, url]):
+            return "Missing parameters", 400
+            
+        # Record the click in the database
+        supabase.table("link_clicks").insert({
+            "lead_id": lead_id,
+            "campaign_id": campaign_id,
+            "url": url,
+            "email_queue_id": email_queue_id
+        }).execute()
+        
+        # Redirect to the original URL
+        return redirect(url)
+        
+    except Exception as e:
+        print(f"Error tracking click: {str(e)}")
+        return "Error tracking click", 500
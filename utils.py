@@ -1,33 +1,119 @@
-# utils.py
-from requests import post
 import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
 
-def callAIML_from_flask(prompt: str) -> str:
+# Models in GH_MODELS are tried in order, but a slow model doesn't hold the
+# request: if no answer has come back after AI_HEDGE_AFTER seconds the next
+# model is started too and the first success wins. A model that answers 429
+# is skipped for Retry-After (or AI_BREAKER_COOLDOWN) seconds.
+AI_HEDGE_AFTER = float(os.environ.get("AI_HEDGE_AFTER", 8))
+AI_TIMEOUT = float(os.environ.get("AI_TIMEOUT", 300))
+AI_CONNECT_TIMEOUT = 10
+AI_BREAKER_COOLDOWN = float(os.environ.get("AI_BREAKER_COOLDOWN", 60))
+
+_session = None
+_executor = None
+_setup_lock = threading.Lock()
+
+_open_until = {}
+_breaker_lock = threading.Lock()
+
+class ModelUnavailable(Exception):
+    """The model answered 404 or 429 (try another one), or no model is left"""
+
+def _get_session():
+    """One keep-alive session (and connection pool) per process"""
+    global _session, _executor
+    if _session is None:
+        with _setup_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+                session.mount("https://", adapter)
+                _executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="aiml")
+                _session = session
+    return _session
+
+def _breaker_open(model):
+    with _breaker_lock:
+        return _open_until.get(model, 0) > time.monotonic()
+
+def _trip_breaker(model, retry_after=None):
+    try:
+        cooldown = float(retry_after) if retry_after else AI_BREAKER_COOLDOWN
+    except ValueError:
+        cooldown = AI_BREAKER_COOLDOWN
+    with _breaker_lock:
+        _open_until[model] = time.monotonic() + cooldown
+    print(f"AI model {model} rate-limited; skipping it for {cooldown:.0f}s")
+
+def _call_model(model, prompt):
     GITHUB_TOKEN = os.environ["GITHUB_TOKEN"]
-    MODELS = os.environ.get("GH_MODELS", "openai/gpt-4o-mini").split(",")
-    for model in MODELS:
-        resp = post(
-            "https://models.github.ai/inference/chat/completions",
-            headers={
-                "Authorization": f"Bearer {GITHUB_TOKEN}",
-                "Accept": "application/vnd.github+json",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": model.strip(),
-                "messages": [
-                    {"role": "system", "content": "You are a professional real estate agent."},
-                    {"role": "user",   "content": prompt}
-                ],
-                "temperature": 0.7,
-                "top_p": 0.7,
-                "max_tokens": 512
-            },
-            timeout=300
-        )
-        if resp.status_code == 200:
-            return resp.json()["choices"][0]["message"]["content"].strip()
-        if resp.status_code in (404, 429):
+    resp = _get_session().post(
+        "https://models.github.ai/inference/chat/completions",
+        headers={
+            "Authorization": f"Bearer {GITHUB_TOKEN}",
+            "Accept": "application/vnd.github+json",
+            "Content-Type": "application/json"
+        },
+        json={
+            "model": model,
+            "messages": [
+                {"role": "system", "content": "You are a professional real estate agent."},
+                {"role": "user",   "content": prompt}
+            ],
+            "temperature": 0.7,
+            "top_p": 0.7,
+            "max_tokens": 512
+        },
+        timeout=(AI_CONNECT_TIMEOUT, AI_TIMEOUT)
+    )
+    if resp.status_code == 200:
+        return resp.json()["choices"][0]["message"]["content"].strip()
+    if resp.status_code == 429:
+        _trip_breaker(model, resp.headers.get("Retry-After"))
+        raise ModelUnavailable(f"{model}: HTTP 429")
+    if resp.status_code == 404:
+        raise ModelUnavailable(f"{model}: HTTP 404")
+    resp.raise_for_status()
+    raise RuntimeError(f"{model}: unexpected HTTP {resp.status_code}")
+
+def callAIML_from_flask(prompt: str) -> str:
+    MODELS = [m.strip() for m in os.environ.get("GH_MODELS", "openai/gpt-4o-mini").split(",") if m.strip()]
+    _get_session()
+
+    queue = iter([m for m in MODELS if not _breaker_open(m)])
+    pending = {}
+    error = None
+
+    def launch():
+        model = next(queue, None)
+        if model is not None:
+            pending[_executor.submit(_call_model, model, prompt)] = model
+        return model is not None
+
+    launch()
+    while pending:
+        done, _ = wait(pending, timeout=AI_HEDGE_AFTER, return_when=FIRST_COMPLETED)
+        if not done:
+            # Hedge: the running model(s) are slow, start the next one as well
+            launch()
             continue
-        resp.raise_for_status()
-    raise RuntimeError("All models failed or were rate‑limited")
+        for future in done:
+            model = pending.pop(future)
+            try:
+                # Requests still in flight are left to finish in the background
+                return future.result()
+            except ModelUnavailable:
+                pass
+            except Exception as e:
+                print(f"AI model {model} failed: {str(e)}")
+                error = e
+            if not pending:
+                launch()
+
+    if error is not None:
+        raise error
+    raise ModelUnavailable("All models failed or were rate‑limited")
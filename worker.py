@@ -1,165 +1,277 @@
 # worker.py
 import os
 import smtplib
-import base64
+import hashlib
+import random
 from email.mime.text import MIMEText
-from datetime import datetime, timedelta, date, timezone
-from supabase import create_client
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from datetime import datetime, timedelta, timezone
 import urllib.parse
 import re
+from send_limits import account_capacity
+from credentials import account_password
+from db import supabase, execute, fetch, fetch_in, rpc
+from metrics import REGISTRY, summary_line
 
-# Initialize Supabase
-SUPABASE_URL = os.environ['SUPABASE_URL']
-SUPABASE_KEY = os.environ['SUPABASE_SERVICE_ROLE_KEY']
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Retry policy for failed sends: exponential backoff from SEND_RETRY_BASE_MINUTES,
+# capped at SEND_RETRY_MAX_MINUTES, dead-lettered after MAX_SEND_ATTEMPTS
+MAX_SEND_ATTEMPTS = int(os.environ.get('MAX_SEND_ATTEMPTS', 5))
+SEND_RETRY_BASE_MINUTES = int(os.environ.get('SEND_RETRY_BASE_MINUTES', 15))
+SEND_RETRY_MAX_MINUTES = int(os.environ.get('SEND_RETRY_MAX_MINUTES', 24 * 60))
 
-# Encryption functions
-ENCRYPTION_KEY = bytes.fromhex(os.environ['ENCRYPTION_KEY'])
+# Each run claims as many due emails as the accounts can still send in
+# total; SEND_BATCH_LIMIT (if set) caps that, e.g. to keep a run short
+SEND_BATCH_LIMIT = int(os.environ.get('SEND_BATCH_LIMIT', 0))
 
-def aesgcm_decrypt(b64text: str) -> str:
-    data = base64.b64decode(b64text)
-    nonce = data[:12]
-    ct = data[12:]
-    aesgcm = AESGCM(ENCRYPTION_KEY)
-    pt = aesgcm.decrypt(nonce, ct, None)
-    return pt.decode('utf-8')
+# Hot-path instrumentation, exported by app.py's /metrics
+STAGE_METRIC = "worker_stage_seconds"
+EMAILS_METRIC = "worker_emails_total"
+REGISTRY.describe(STAGE_METRIC, "Time spent in each send_queued stage during the last worker run")
+REGISTRY.describe(EMAILS_METRIC, "Emails handled during the last worker run, by result")
+# worker_metrics rows older than this are deleted after each run
+WORKER_METRICS_RETENTION_DAYS = int(os.environ.get('WORKER_METRICS_RETENTION_DAYS', 7))
 
-def send_email_via_smtp(account, to_email, subject, html_body):
-    """Send email using SMTP"""
+def timed(stage):
+    return REGISTRY.timer(STAGE_METRIC, stage=stage)
+
+def make_message_id(email_queue_id, account_email):
+    """Deterministic Message-ID for a queued email, used to match replies"""
+    domain = account_email.rsplit("@", 1)[-1]
+    digest = hashlib.sha256(f"{email_queue_id}:{account_email}".encode("utf-8")).hexdigest()[:16]
+    return f"<eq{email_queue_id}.{digest}@{domain}>"
+
+class SMTPAccountError(Exception):
+    """Connecting, starting TLS or logging in with the sending account failed"""
+
+def is_account_smtp_error(error):
+    """
+    The sending account (or its server) couldn't be used at all, so the
+    failure says nothing about the email itself.
+    """
+    return isinstance(error, (SMTPAccountError, smtplib.SMTPSenderRefused,
+                              smtplib.SMTPConnectError, smtplib.SMTPHeloError))
+
+def is_permanent_smtp_error(error):
+    """
+    Only 5xx replies to the recipient or to the message data are permanent.
+    4xx replies, dropped connections and anything the account caused (a 554
+    at connect or HELO, auth, sender refused) may clear up later.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+        return bool(codes) and all(500 <= code < 600 for code in codes)
+    if isinstance(error, smtplib.SMTPDataError):
+        return 500 <= error.smtp_code < 600
+    return False
+
+def send_email_via_smtp(account, to_email, subject, html_body, message_id=None):
+    """
+    Send email using SMTP. Returns (success, error); failures before the
+    message is sent come back as SMTPAccountError.
+    """
     try:
-        # Decrypt SMTP password
-        smtp_password = aesgcm_decrypt(account["encrypted_smtp_password"])
-        
         # Create message
         msg = MIMEText(html_body, "html")
         msg["Subject"] = subject
         msg["From"] = f"{account['display_name']} <{account['email']}>"
         msg["To"] = to_email
+        if message_id:
+            msg["Message-ID"] = message_id
         
         # Send email
-        smtp = smtplib.SMTP(account["smtp_host"], account["smtp_port"])
-        smtp.starttls()  # Use TLS
-        smtp.login(account["smtp_username"], smtp_password)
-        smtp.send_message(msg)
-        smtp.quit()
-        return True
+        with timed("smtp_connect"):
+            try:
+                # Decrypted once per process and cached
+                smtp_password = account_password(account)
+                smtp = smtplib.SMTP(account["smtp_host"], account["smtp_port"])
+                smtp.starttls()  # Use TLS
+                smtp.login(account["smtp_username"], smtp_password)
+            except Exception as e:
+                raise SMTPAccountError(e) from e
+        with timed("smtp_send"):
+            smtp.send_message(msg)
+            smtp.quit()
+        return True, None
     except Exception as e:
         print(f"Error sending email via SMTP: {str(e)}")
-        return False
+        return False, e
+
+def record_send_failure(q, error):
+    """
+    Reschedule a failed email with backoff, or dead-letter it. Account-level
+    failures are retried after SEND_RETRY_BASE_MINUTES without counting an
+    attempt, so a broken account can't dead-letter its whole queue.
+    """
+    update_data = {"last_error": str(error)[:500]}
+
+    if is_account_smtp_error(error):
+        delay = SEND_RETRY_BASE_MINUTES * random.uniform(0.8, 1.2)
+        retry_at = datetime.now(timezone.utc) + timedelta(minutes=delay)
+        update_data["scheduled_for"] = retry_at.isoformat()
+        print(f"Account error for email {q['id']} to {q['lead_email']}, retrying at {retry_at.isoformat()}: {error}")
+    else:
+        attempts = (q.get("attempts") or 0) + 1
+        update_data["attempts"] = attempts
+        if is_permanent_smtp_error(error) or attempts >= MAX_SEND_ATTEMPTS:
+            update_data["status"] = "dead"
+            print(f"Dead-lettered email {q['id']} to {q['lead_email']} after {attempts} attempt(s): {error}")
+        else:
+            delay = min(SEND_RETRY_BASE_MINUTES * 2 ** (attempts - 1), SEND_RETRY_MAX_MINUTES)
+            delay = delay * random.uniform(0.8, 1.2)
+            retry_at = datetime.now(timezone.utc) + timedelta(minutes=delay)
+            update_data["scheduled_for"] = retry_at.isoformat()
+            print(f"Retrying email {q['id']} to {q['lead_email']} at {retry_at.isoformat()} (attempt {attempts})")
 
-def get_account_for_lead_campaign(lead_id, campaign_id):
-    """Get the assigned SMTP account for a lead/campaign combination"""
     try:
-        # Check if we already have an account assigned for this lead/campaign
-        assignment = supabase.table("lead_campaign_accounts") \
-            .select("smtp_account") \
-            .eq("lead_id", lead_id) \
-            .eq("campaign_id", campaign_id) \
-            .execute()
-        
-        if assignment.data:
-            # Get the account details
-            account = supabase.table("smtp_accounts") \
-                .select("*") \
-                .eq("email", assignment.data[0]["smtp_account"]) \
-                .single() \
-                .execute()
-            return account.data
-        return None
-    except:
-        return None
+        with timed("db_write"):
+            execute(supabase.table("email_queue").update(update_data).match({"id": q["id"]}))
+    except Exception as e:
+        print(f"Error recording send failure for email {q['id']}: {str(e)}")
 
 def assign_account_to_lead_campaign(lead_id, campaign_id, account_email):
     """Assign an SMTP account to a lead/campaign combination"""
-    supabase.table("lead_campaign_accounts").upsert({
-        "lead_id": lead_id,
-        "campaign_id": campaign_id,
-        "smtp_account": account_email
-    }).execute()
+    with timed("db_write"):
+        execute(supabase.table("lead_campaign_accounts").upsert({
+            "lead_id": lead_id,
+            "campaign_id": campaign_id,
+            "smtp_account": account_email
+        }))
 
 def get_all_accounts_with_capacity():
-    """Get all SMTP accounts with their current usage and capacity"""
-    today = date.today().isoformat()
-    
+    """Get all SMTP accounts with their recent usage and remaining capacity"""
     # Get all accounts
-    accounts = supabase.table("smtp_accounts").select("*").execute()
-    
+    with timed("account_lookup"):
+        accounts = fetch("smtp_accounts")
+    with timed("capacity_lookup"):
+        capacity = account_capacity(supabase, accounts)
+
     accounts_with_capacity = []
-    for account in accounts.data:
-        # Get today's count for this account
-        count_data = supabase.table("daily_email_counts") \
-            .select("count") \
-            .eq("email_account", account["email"]) \
-            .eq("date", today) \
-            .execute()
-        
-        if count_data.data:
-            count = count_data.data[0]["count"]
-        else:
-            count = 0
-            
-        # Calculate remaining capacity
-        remaining = 100 - count
-        
-        if remaining > 0:
+    for account in accounts:
+        usage = capacity[account["email"]]
+        if usage["remaining"] > 0:
             accounts_with_capacity.append({
                 "account": account,
-                "sent_today": count,
-                "remaining": remaining
+                "limit": usage["limit"],
+                "sent_recent": usage["sent_recent"],
+                "remaining": usage["remaining"]
             })
     
     # Sort by remaining capacity (descending) to prioritize accounts with most capacity
     accounts_with_capacity.sort(key=lambda x: x["remaining"], reverse=True)
     return accounts_with_capacity
 
-def update_daily_count(email_account, count):
-    """Update the daily count for an account"""
-    today = date.today().isoformat()
-    
-    # Check if record exists
-    existing = supabase.table("daily_email_counts") \
-        .select("id") \
-        .eq("email_account", email_account) \
-        .eq("date", today) \
-        .execute()
-    
-    if existing.data:
-        # Update existing record
-        supabase.table("daily_email_counts") \
-            .update({"count": count}) \
-            .eq("email_account", email_account) \
-            .eq("date", today) \
-            .execute()
-    else:
-        # Create new record
-        supabase.table("daily_email_counts") \
-            .insert({
-                "email_account": email_account,
-                "date": today,
-                "count": count
-            }) \
-            .execute()
+def pick_account(available_accounts):
+    """
+    Smooth weighted round-robin: over a batch each account is picked in
+    proportion to its free capacity (remaining minus what's reserved for
+    claimed rows already assigned to it), interleaved rather than in runs.
+    Returns None if no account has free capacity.
+    """
+    free = {id(acc): acc["remaining"] - acc.get("reserved", 0) for acc in available_accounts}
+    candidates = [acc for acc in available_accounts if free[id(acc)] > 0]
+    if not candidates:
+        return None
+    total = sum(free[id(acc)] for acc in candidates)
+    for acc in candidates:
+        acc["current_weight"] = acc.get("current_weight", 0) + free[id(acc)]
+    chosen = max(candidates, key=lambda acc: acc["current_weight"])
+    chosen["current_weight"] -= total
+    return chosen
+
+def _fair_order(rows, capacity, limit):
+    """
+    Drop rows whose assigned account is out of capacity (or would be after
+    earlier rows), then interleave campaigns round-robin. A campaign with
+    priority p gets p + 1 slots per round.
+    """
+    taken = {}
+    per_campaign = {}
+    ranked = []
+    for row in sorted(rows, key=lambda r: (-r["priority"], r["scheduled_for"], r["id"])):
+        assigned = row.get("assigned_account")
+        if assigned:
+            if taken.get(assigned, 0) >= capacity.get(assigned, 0):
+                continue
+            taken[assigned] = taken.get(assigned, 0) + 1
+        rank = per_campaign.get(row["campaign_id"], 0) + 1
+        per_campaign[row["campaign_id"]] = rank
+        ranked.append((rank / (1 + max(row["priority"], 0)), -row["priority"], row["scheduled_for"], row["id"], row))
+    ranked.sort(key=lambda item: item[:4])
+    return [item[-1] for item in ranked[:limit]]
+
+def claim_due_emails(available_accounts, limit=None):
+    """
+    Get due emails we can actually send this run: rows assigned to an
+    account without capacity are left out, and campaigns are interleaved
+    fairly so one large campaign or saturated account can't block the rest.
+    At most the accounts' summed remaining capacity (or limit, if lower)
+    are returned. Each row carries its assigned_account (or None).
+    """
+    capacity = {acc["account"]["email"]: acc["remaining"] for acc in available_accounts}
+    total = sum(capacity.values())
+    limit = min(limit, total) if limit else total
+    if limit <= 0:
+        return []
+
+    try:
+        # Selection happens in the database (see sql/006_claim_due_emails.sql)
+        result = rpc("claim_due_emails", {"p_capacity": capacity, "p_limit": limit}, idempotent=True)
+        return result.data or []
+    except Exception as e:
+        print(f"claim_due_emails RPC unavailable, selecting in Python: {str(e)}")
+
+    # Oversample the oldest due rows and apply the same rules locally
+    due = execute(
+        supabase.table("email_queue")
+        .select("*")
+        .is_("sent_at", "null")
+        .eq("status", "queued")
+        .lte("scheduled_for", datetime.now(timezone.utc).isoformat())
+        .order("scheduled_for")
+        .limit(limit * 5)
+    )
+    if not due.data:
+        return []
+
+    lead_ids = sorted({q["lead_id"] for q in due.data})
+    campaign_ids = sorted({q["campaign_id"] for q in due.data})
+    assignments = fetch_in("lead_campaign_accounts", "lead_id", lead_ids, columns="lead_id, campaign_id, smtp_account")
+    try:
+        campaigns = fetch_in("campaigns", "id", campaign_ids, columns="id, priority")
+        priorities = {c["id"]: c.get("priority") or 0 for c in campaigns}
+    except Exception:
+        # campaigns.priority not migrated yet: treat every campaign equally
+        priorities = {}
+
+    assigned = {(a["lead_id"], a["campaign_id"]): a["smtp_account"] for a in assignments}
+    for q in due.data:
+        q["assigned_account"] = assigned.get((q["lead_id"], q["campaign_id"]))
+        q["priority"] = priorities.get(q["campaign_id"], 0)
+    return _fair_order(due.data, capacity, limit)
 
 def send_queued():
     print("DEBUG: send_queued function called")
     current_time = datetime.now(timezone.utc)
     print(f"DEBUG: Current time (UTC): {current_time.isoformat()}")
     
-    # Get queued emails that are scheduled for now or earlier
-    queued = (
-        supabase.table("email_queue")
-        .select("*")
-        .is_("sent_at", "null")
-        .lte("scheduled_for", current_time.isoformat())
-        .limit(100)
-        .execute()
-    )
+    # Get all accounts with capacity
+    available_accounts = get_all_accounts_with_capacity()
+    
+    if not available_accounts:
+        print("All accounts are out of send capacity.")
+        return
+        
+    print(f"Found {len(available_accounts)} accounts with capacity: " + ", ".join(
+        f"{acc['account']['email']}={acc['remaining']}/{acc['limit']}" for acc in available_accounts
+    ))
+    
+    # Get queued emails that are due and sendable by an account with capacity
+    with timed("queue_claim"):
+        queued = claim_due_emails(available_accounts, limit=SEND_BATCH_LIMIT or None)
 
     # Add debug info about the query results
-    print(f"DEBUG: Found {len(queued.data)} queued emails")
+    print(f"DEBUG: Found {len(queued)} queued emails")
     
-    if not queued.data:
+    if not queued:
         print("DEBUG: No queued emails ready to send.")
         # Let's check if there are any emails in the queue at all
         all_queued = supabase.table("email_queue").select("*").execute()
@@ -174,112 +286,116 @@ def send_queued():
                 print(f"DEBUG: Unsent email - ID: {email['id']}, Scheduled: {email['scheduled_for']}, Now: {current_time.isoformat()}")
         return
 
-    # Get all accounts with capacity
-    available_accounts = get_all_accounts_with_capacity()
-    
-    if not available_accounts:
-        print("All accounts have reached their daily limit (50 emails).")
-        return
-        
-    print(f"Found {len(available_accounts)} accounts with capacity")
-    
+    # Capacity the claim set aside for rows already assigned to an account;
+    # unassigned rows are spread over what's left
+    reserved = {}
+    for q in queued:
+        if q.get("assigned_account"):
+            reserved[q["assigned_account"]] = reserved.get(q["assigned_account"], 0) + 1
+    for acc in available_accounts:
+        acc["reserved"] = reserved.get(acc["account"]["email"], 0)
+
     sent_count = 0
     failed_count = 0
     
-    # Distribute emails across available accounts
-    account_index = 0
-    total_accounts = len(available_accounts)
-    
-    for q in queued.data:
+    for q in queued:
         # Check if there's an assigned account for this lead/campaign
-        assigned_account = get_account_for_lead_campaign(q["lead_id"], q["campaign_id"])
+        assigned_account = q.get("assigned_account")
         
         if assigned_account:
             # Use the assigned account if it has capacity
             account_found = None
             for acc in available_accounts:
-                if acc["account"]["email"] == assigned_account["email"] and acc["remaining"] > 0:
+                if acc["account"]["email"] == assigned_account and acc["remaining"] > 0:
                     account_found = acc
                     break
             
             if account_found:
                 account_data = account_found
                 account = account_data["account"]
-                current_count = account_data["sent_today"]
+                account_data["reserved"] -= 1
             else:
                 # Skip this email if the assigned account doesn't have capacity
                 print(f"Skipping email for {q['lead_email']} - assigned account has no capacity")
+                REGISTRY.inc(EMAILS_METRIC, result="skipped")
                 continue
         else:
-            # Use round-robin for emails without an assigned account
-            if account_index >= total_accounts:
-                account_index = 0
-                
-            account_data = available_accounts[account_index]
+            # Spread unassigned emails in proportion to remaining capacity
+            account_data = pick_account(available_accounts)
+            if account_data is None:
+                print(f"Skipping email for {q['lead_email']} - no account has free capacity")
+                REGISTRY.inc(EMAILS_METRIC, result="skipped")
+                continue
             account = account_data["account"]
-            current_count = account_data["sent_today"]
             
             # Assign this account to the lead/campaign for future emails
             assign_account_to_lead_campaign(q["lead_id"], q["campaign_id"], account["email"])
         
         try:
-            tracked_body = replace_urls_with_tracking(
-                 q["body"], 
-                 q["lead_id"], 
-                 q["campaign_id"],
-                 q["id"]  # email_queue_id
-            )
+            with timed("tracking_rewrite"):
+                tracked_body = replace_urls_with_tracking(
+                     q["body"], 
+                     q["lead_id"], 
+                     q["campaign_id"],
+                     q["id"]  # email_queue_id
+                )
+
+            message_id = make_message_id(q["id"], account["email"])
 
-            success = send_email_via_smtp(
+            success, error = send_email_via_smtp(
                 account=account,
                 to_email=q["lead_email"],
                 subject=q["subject"],
-                html_body=tracked_body
+                html_body=tracked_body,
+                message_id=message_id
             )
 
             if success:
                 # Mark as sent
                 update_data = {
                     "sent_at": datetime.now(timezone.utc).isoformat(),
-                    "sent_from": account["email"]
+                    "sent_from": account["email"],
+                    "message_id": message_id
                 }
-                supabase.table("email_queue").update(update_data).match({"id": q["id"]}).execute()
+                with timed("db_write"):
+                    execute(supabase.table("email_queue").update(update_data).match({"id": q["id"]}))
                 
-                # Update daily count for this account
-                new_count = current_count + 1
-                update_daily_count(account["email"], new_count)
-                
-                # Update our local count
-                account_data["sent_today"] = new_count
-                account_data["remaining"] = 100 - new_count
+                # Update our local capacity; the limiter derives usage from sent_at
+                account_data["sent_recent"] += 1
+                account_data["remaining"] -= 1
                 
                 # If this account is now at capacity, remove it from available accounts
-                if new_count >= 100:
-                    available_accounts.pop(account_index)
-                    total_accounts = len(available_accounts)
-                    if total_accounts == 0:
-                        print("All accounts have reached their daily limit.")
+                if account_data["remaining"] <= 0:
+                    available_accounts.remove(account_data)
+                    if not available_accounts:
+                        print("All accounts are out of send capacity.")
                         break
-                    # Adjust index if we removed the current account
-                    if account_index >= total_accounts:
-                        account_index = 0
-                else:
-                    account_index += 1
                 
                 # If this is an initial email (sequence 0), schedule the first follow-up
                 next_sequence = q["sequence"] + 1
                 schedule_followup(q, next_sequence, account["email"])
                 
                 sent_count += 1
+                REGISTRY.inc(EMAILS_METRIC, result="sent")
             else:
                 print(f"Failed to send to {q['lead_email']}")
+                record_send_failure(q, error)
                 failed_count += 1
-                account_index += 1  # Move to next account even on failure
+                REGISTRY.inc(EMAILS_METRIC, result="failed")
+
+                # Don't keep hitting an account that can't send; its other
+                # emails stay queued for the next run
+                if is_account_smtp_error(error) and account_data in available_accounts:
+                    available_accounts.remove(account_data)
+                    if not available_accounts:
+                        print("No usable accounts left this run.")
+                        break
                 
         except Exception as e:
             print(f"Error sending email to {q['lead_email']}: {str(e)}")
+            record_send_failure(q, e)
             failed_count += 1
-            account_index += 1  # Move to next account on error
+            REGISTRY.inc(EMAILS_METRIC, result="failed")
 
     print(f"✅ Sent {sent_count} emails. Failed: {failed_count}")
 
@@ -287,40 +403,38 @@ def schedule_followup(q, sequence, account_email):
     """Schedule a follow-up email using the same account"""
     try:
         # Get the follow-up for this campaign and sequence
-        follow_up = (
-            supabase.table("campaign_followups")
-            .select("*")
-            .eq("campaign_id", q["campaign_id"])
-            .eq("sequence", sequence)
-            .execute()
-        )
+        with timed("db_read"):
+            follow_up = fetch("campaign_followups", eq={"campaign_id": q["campaign_id"], "sequence": sequence})
         
-        if not follow_up.data:
+        if not follow_up:
             return  # No follow-up for this sequence
         
-        follow_up = follow_up.data[0]
+        follow_up = follow_up[0]
         # Get lead data
-        lead = supabase.table("leads").select("*").eq("id", q["lead_id"]).single().execute()
+        with timed("db_read"):
+            lead = fetch("leads", eq={"id": q["lead_id"]})
         
-        if lead.data:
+        if lead:
             # Calculate send date
             days_delay = follow_up["days_after_previous"]
             send_date = datetime.now(timezone.utc) + timedelta(days=days_delay)
             
             # Render template with lead data
-            rendered_subject = render_email_template(follow_up["subject"], lead.data)
-            rendered_body = render_email_template(follow_up["body"], lead.data)
+            with timed("render"):
+                rendered_subject = render_email_template(follow_up["subject"], lead[0])
+                rendered_body = render_email_template(follow_up["body"], lead[0])
             
             # Queue follow-up with the same account
-            supabase.table("email_queue").insert({
-                "campaign_id": q["campaign_id"],
-                "lead_id": q["lead_id"],
-                "lead_email": q["lead_email"],
-                "subject": rendered_subject,
-                "body": rendered_body,
-                "sequence": sequence,
-                "scheduled_for": send_date.isoformat()
-            }).execute()
+            with timed("db_write"):
+                execute(supabase.table("email_queue").insert({
+                    "campaign_id": q["campaign_id"],
+                    "lead_id": q["lead_id"],
+                    "lead_email": q["lead_email"],
+                    "subject": rendered_subject,
+                    "body": rendered_body,
+                    "sequence": sequence,
+                    "scheduled_for": send_date.isoformat()
+                }), idempotent=False)
     except Exception as e:
         print(f"Error scheduling follow-up: {str(e)}")
 
@@ -380,5 +494,26 @@ def replace_urls_with_tracking(html_content, lead_id, campaign_id, email_queue_i
     # Replace all URLs
     return re.sub(pattern, replace_with_tracking, html_content)
 
+def report_run_metrics():
+    """
+    Print a one-line stage summary, store this run's metrics for /metrics
+    and delete rows past WORKER_METRICS_RETENTION_DAYS
+    """
+    now = datetime.now(timezone.utc)
+    snapshot = REGISTRY.snapshot()
+    snapshot["finished_at"] = now.timestamp()
+    print(f"METRICS {summary_line(snapshot, STAGE_METRIC)}")
+    try:
+        execute(supabase.table("worker_metrics").insert({"snapshot": snapshot}), idempotent=False)
+    except Exception as e:
+        print(f"Error storing worker metrics: {str(e)}")
+
+    try:
+        cutoff = (now - timedelta(days=WORKER_METRICS_RETENTION_DAYS)).isoformat()
+        execute(supabase.table("worker_metrics").delete().lt("created_at", cutoff))
+    except Exception as e:
+        print(f"Error pruning worker metrics: {str(e)}")
+
 if __name__ == "__main__":
     send_queued()
+    report_run_metrics()